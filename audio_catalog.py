@@ -0,0 +1,120 @@
+# Catalog of the audio folders played while idle.
+
+# The folders are listed once, and listed again only when their
+# modification time changes, checked by a background thread, so picking a
+# clip does no filesystem access. Clips are picked from a shuffle bag:
+# every clip of a folder is played once before any is played again, and
+# the same clip is never played twice in a row.
+
+"""
+Modules:
+    os
+    random
+    threading
+    wave
+"""
+
+import os
+import random
+import threading
+import wave
+
+DEBUG = True
+
+# Seconds between the checks of the folders for changes
+REFRESH_INTERVAL = 10
+
+def get_wav_duration(file_path):
+    """Return the duration of a .wav file in seconds, 0 if it can't be read"""
+    try:
+        with wave.open(file_path, "rb") as wav_file:
+            return wav_file.getnframes() / wav_file.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return 0.0
+
+class ShuffleBag:
+    """Random picks among items, every item once before any is repeated"""
+    def __init__(self, items=()):
+        self.items = list(items)
+        self.bag = []
+        self.last = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def update(self, items):
+        """Replace the items, keeping the round going for the ones left"""
+        self.items = list(items)
+        kept = set(self.items)
+        self.bag = [item for item in self.bag if item in kept]
+
+    def pick(self):
+        """Return the next item, or None if there is none"""
+        if not self.items:
+            return None
+        if not self.bag:
+            self.bag = list(self.items)
+            random.shuffle(self.bag)
+            # Don't start the round with the last item of the previous one
+            if len(self.bag) > 1 and self.bag[-1] == self.last:
+                self.bag[0], self.bag[-1] = self.bag[-1], self.bag[0]
+        self.last = self.bag.pop()
+        return self.last
+
+class AudioCatalog(threading.Thread):
+    """Thread keeping the lists of the .wav files of some folders.
+
+    folders maps a name to a folder, and pick(name) returns the path of a
+    clip of that folder.
+    """
+    def __init__(self, folders, refresh_interval=REFRESH_INTERVAL):
+        super().__init__()
+        self.daemon = True
+        self.folders = dict(folders)
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.mtimes = {}
+        self.bags = {name: ShuffleBag() for name in self.folders}
+        self.refresh()
+
+    def refresh(self):
+        """List again the folders modified since they were last listed"""
+        for name, folder in self.folders.items():
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except OSError:
+                mtime = None
+            if name in self.mtimes and self.mtimes[name] == mtime:
+                continue
+
+            files = []
+            if mtime is not None:
+                files = sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                               if f.endswith(".wav"))
+            with self.lock:
+                self.mtimes[name] = mtime
+                self.bags[name].update(files)
+            if DEBUG:
+                print(f"Audio catalog: {len(files)} clips in {folder}")
+
+    def pick(self, name):
+        """Return the path of the next clip of a folder, or None if it has none"""
+        with self.lock:
+            return self.bags[name].pick()
+
+    def count(self, name):
+        with self.lock:
+            return len(self.bags[name])
+
+    def stop(self):
+        """Stop the catalog thread"""
+        self.stop_event.set()
+        self.join()
+
+    def run(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except OSError as e:
+                print(f"Error refreshing the audio catalog: {e}")
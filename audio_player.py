@@ -0,0 +1,135 @@
+# Thread playing the queued audio files one after the other.
+
+# The thread blocks on the queue while it is empty, and while a clip plays
+# it waits on the stop event for the duration of the clip, so it uses no
+# CPU between clips and stops at once. The next clip starts as soon as the
+# previous one ends. The dead air between clips played back to back and
+# the CPU time used by the thread are measured.
+# With a SoundCache, the clips it caches are played from their decoded
+# sounds instead of being read and decoded from disk again.
+
+"""
+Modules:
+    collections
+    threading
+    time
+    pygame: Audio playback
+"""
+
+import collections
+import threading
+import time
+
+import pygame
+
+from audio_catalog import get_wav_duration
+
+DEBUG = True
+
+# Seconds between the checks of the end of a clip, once its duration
+# is over or when it isn't known
+END_POLL_INTERVAL = 0.005
+
+# Number of gaps between clips kept for the stats
+MAX_GAPS = 100
+
+class AudioPlayer(threading.Thread):
+    """Thread playing the audio files put on audio_queue until stop_event is set.
+
+    before_play, if given, is called with every audio file before it is
+    played, and its time is counted in the gap, as the silence it is.
+    """
+    def __init__(self, stop_event, audio_queue, playback_lock, before_play=None,
+                 sound_cache=None):
+        super().__init__()
+        self.stop_event = stop_event
+        self.audio_queue = audio_queue
+        self.playback_lock = playback_lock
+        self.before_play = before_play
+        self.sound_cache = sound_cache
+        self.current_audio_file = None
+        self.gaps = collections.deque(maxlen=MAX_GAPS)
+        self.cpu_time = 0.0
+        self.run_time = 0.0
+        pygame.mixer.init()
+
+    def run(self):
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        # End of the last clip, if the next one was already queued then
+        backlog_since = None
+        while not self.stop_event.is_set():
+            audio_file = self.audio_queue.get()
+            if audio_file is None:
+                # A None left from an earlier stop doesn't stop this player
+                if self.stop_event.is_set():
+                    break
+                continue
+
+            if self.before_play:
+                self.before_play(audio_file)
+
+            play_started = self.play_audio(audio_file)
+            if backlog_since is not None and play_started is not None:
+                self.gaps.append(play_started - backlog_since)
+            self.audio_queue.task_done()
+
+            backlog_since = None
+            if not self.audio_queue.empty():
+                backlog_since = time.perf_counter()
+
+        self.cpu_time = time.thread_time() - cpu_started
+        self.run_time = time.perf_counter() - started
+        if DEBUG:
+            stats = self.stats()
+            print(f"Audio playback thread exiting, mean gap {stats['mean_gap'] * 1000:.1f} ms, "
+                  f"{stats['cpu_per_hour']:.1f} s of CPU per hour")
+        else:
+            print("Audio playback thread exiting...")
+
+    def play_audio(self, audio_file):
+        """Play an audio file to its end or until stopped, returning when it started"""
+        try:
+            with self.playback_lock:
+                # Stop the current playback if it exists
+                pygame.mixer.music.stop()
+
+                # Play the decoded sound if it is cached, or else
+                # stream the audio file from disk
+                playback = None
+                if self.sound_cache is not None and self.sound_cache.caches(audio_file):
+                    sound = self.sound_cache.get(audio_file)
+                    playback = sound.play()
+                    duration = sound.get_length()
+                if playback is None:
+                    pygame.mixer.music.load(audio_file)
+                    pygame.mixer.music.play()
+                    playback = pygame.mixer.music
+                    # 0 for files other than .wav, whose end is polled
+                    duration = get_wav_duration(audio_file)
+                play_started = time.perf_counter()
+                self.current_audio_file = audio_file
+
+                # Sleep through the clip, waking up at once if stopped
+                if duration and self.stop_event.wait(duration - END_POLL_INTERVAL):
+                    playback.stop()
+                    return play_started
+
+                # Then wait for the mixer to play the end of the clip
+                while playback.get_busy():
+                    if self.stop_event.wait(END_POLL_INTERVAL):
+                        playback.stop()
+                        break
+                return play_started
+        except Exception as e:
+            print(f"Error playing audio file {audio_file}: {e}")
+            return None
+
+    def stats(self):
+        """Return the mean and max gap between clips and the CPU use"""
+        gaps = list(self.gaps)
+        return {
+            "mean_gap": sum(gaps) / len(gaps) if gaps else 0.0,
+            "max_gap": max(gaps) if gaps else 0.0,
+            "cpu_per_hour": self.cpu_time / self.run_time * 3600 if self.run_time else 0.0,
+        }
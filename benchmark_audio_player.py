@@ -0,0 +1,150 @@
+# This script compares the AudioPlayer of audio_player with the polling
+# player it replaced: the dead air between clips queued back to back and
+# before a clip queued to an idle player, the CPU used while the queue is
+# empty, and the time taken to stop. It plays short generated clips
+# on SDL's dummy audio driver, so it needs no sound card.
+
+#! /usr/bin/python3
+
+"""
+Modules:
+    os
+    queue
+    statistics
+    tempfile
+    threading
+    time
+    wave
+    pygame: Audio playback
+"""
+
+import os
+import queue
+import statistics
+import tempfile
+import threading
+import time
+import wave
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import audio_player
+from audio_player import AudioPlayer
+
+CLIPS = 10
+CLIP_DURATION = 0.5
+SAMPLE_RATE = 22050
+
+# Seconds the players are left with an empty queue
+IDLE_TIME = 5
+
+# Seconds of idle time before each of the clips queued while idle
+IDLE_OFFSETS = [0.25, 0.75, 1.25, 1.75]
+
+class PollingAudioPlayer(threading.Thread):
+    """The player before audio_player, polling the queue and the mixer"""
+    def __init__(self, stop_event, audio_queue, playback_lock):
+        super().__init__()
+        self.stop_event = stop_event
+        self.audio_queue = audio_queue
+        self.playback_lock = playback_lock
+        pygame.mixer.init()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                audio_file = self.audio_queue.get(timeout=1)
+                if audio_file is None:
+                    break
+                self.play_audio(audio_file)
+                self.audio_queue.task_done()
+            except queue.Empty:
+                time.sleep(1)
+
+    def play_audio(self, audio_file):
+        with self.playback_lock:
+            pygame.mixer.music.stop()
+            pygame.mixer.music.load(audio_file)
+            pygame.mixer.music.play()
+            while pygame.mixer.music.get_busy():
+                if self.stop_event.is_set():
+                    pygame.mixer.music.stop()
+                    break
+                pygame.time.Clock().tick(10)
+
+def write_clip(file_path):
+    """Write CLIP_DURATION seconds of silence to a .wav file"""
+    with wave.open(file_path, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(b"\0\0" * int(CLIP_DURATION * SAMPLE_RATE))
+
+def wait_busy():
+    """Return the seconds until the mixer starts playing"""
+    started = time.perf_counter()
+    while not pygame.mixer.music.get_busy():
+        time.sleep(0.001)
+    return time.perf_counter() - started
+
+def measure(player_class, clips):
+    """Return the mean gap between clips, the CPU per hour while idle,
+    the seconds to start a clip queued while idle and to stop"""
+    stop_event = threading.Event()
+    audio_queue = queue.Queue()
+    player = player_class(stop_event, audio_queue, threading.Lock())
+    player.start()
+
+    # Back to back: the time beyond the clips themselves is dead air
+    started = time.perf_counter()
+    for clip in clips:
+        audio_queue.put(clip)
+    audio_queue.join()
+    mean_gap = (time.perf_counter() - started - len(clips) * CLIP_DURATION) / len(clips)
+
+    # Idle: the CPU of the process while the player waits for clips
+    time.sleep(1.5)
+    cpu_started = time.process_time()
+    time.sleep(IDLE_TIME)
+    cpu_per_hour = (time.process_time() - cpu_started) / IDLE_TIME * 3600
+
+    # Clips queued while idle, as the idle flow does, at several
+    # points of the polling cycle
+    start_times = []
+    for offset in IDLE_OFFSETS:
+        time.sleep(offset)
+        audio_queue.put(clips[0])
+        start_times.append(wait_busy())
+        audio_queue.join()
+    start_time = statistics.mean(start_times)
+
+    audio_queue.put(clips[0])
+    wait_busy()
+
+    # Stop in the middle of the clip
+    time.sleep(CLIP_DURATION / 2)
+    stop_started = time.perf_counter()
+    stop_event.set()
+    audio_queue.put(None)
+    player.join()
+    return mean_gap, cpu_per_hour, start_time, time.perf_counter() - stop_started
+
+def main():
+    """Main function"""
+    audio_player.DEBUG = False
+    with tempfile.TemporaryDirectory() as folder:
+        clips = []
+        for idx in range(CLIPS):
+            clips.append(os.path.join(folder, f"clip_{idx}.wav"))
+            write_clip(clips[-1])
+
+        for name, player_class in (("polling", PollingAudioPlayer), ("AudioPlayer", AudioPlayer)):
+            mean_gap, cpu_per_hour, start_time, stop_time = measure(player_class, clips)
+            print(f"{name:<12} gap {mean_gap * 1000:7.1f} ms  "
+                  f"idle CPU {cpu_per_hour:6.1f} s/hour  "
+                  f"start when idle {start_time * 1000:7.1f} ms  stop {stop_time * 1000:6.1f} ms")
+
+if __name__ == "__main__":
+    main()
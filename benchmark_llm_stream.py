@@ -0,0 +1,92 @@
+# This script runs the poem generation against the fake LLAMA3 API and
+# reports the time to the first line and to the whole poem, for the
+# requests client, the asyncio client, concurrent asyncio requests and
+# requests with injected failures.
+
+#! /usr/bin/python3
+
+"""
+Modules:
+    asyncio
+    statistics
+    fake_llm_server
+    llm_client
+"""
+
+import asyncio
+import statistics
+
+import fake_llm_server
+import llm_client
+from fake_llm_server import FakeLlamaBackend
+from llm_client import LlamaClient, LlamaError
+
+PROMPT = "Write a short, joyful 5 line poem about a benchmark"
+
+REQUESTS = 10
+CONCURRENT_REQUESTS = 4
+
+TOKEN_RATE = 200.0
+LATENCY = 0.05
+
+def report(name, streams):
+    """Print the median times of a list of finished streams"""
+    first_lines = [stream.time_to_first_line for stream in streams]
+    completes = [stream.time_to_complete for stream in streams]
+    print(f"{name:<22} first line {statistics.median(first_lines) * 1000:7.1f} ms  "
+          f"complete {statistics.median(completes) * 1000:7.1f} ms")
+
+def run_sync(client):
+    """Generate poems one after the other with the requests client"""
+    streams = []
+    for _ in range(REQUESTS):
+        stream = client.stream(client.generate(PROMPT))
+        stream.read()
+        streams.append(stream)
+    return streams
+
+async def run_async(client, concurrency):
+    """Generate poems with the asyncio client, concurrency at a time"""
+    async def generate():
+        stream = await client.generate_async(PROMPT)
+        await stream.read_async()
+        return stream
+
+    streams = []
+    for _ in range(REQUESTS // concurrency):
+        streams += await asyncio.gather(*(generate() for _ in range(concurrency)))
+    return streams
+
+async def run_failing(client):
+    """Count the requests that fail with failures injected"""
+    failures = 0
+    for _ in range(REQUESTS):
+        try:
+            await client.generate_text_async(PROMPT)
+        except LlamaError:
+            failures += 1
+    return failures
+
+def main():
+    """Main function"""
+    fake_llm_server.DEBUG = False
+    llm_client.DEBUG = False
+
+    backend = FakeLlamaBackend(token_rate=TOKEN_RATE, latency=LATENCY, load_time=0)
+    backend.start()
+    client = LlamaClient(backend)
+    print(f"Fake API at {TOKEN_RATE:.0f} tokens/s, {LATENCY * 1000:.0f} ms latency")
+    report("requests", run_sync(client))
+    report("asyncio", asyncio.run(run_async(client, 1)))
+    report(f"asyncio x{CONCURRENT_REQUESTS}", asyncio.run(run_async(client, CONCURRENT_REQUESTS)))
+    backend.stop()
+
+    failing_backend = FakeLlamaBackend(token_rate=TOKEN_RATE, latency=LATENCY,
+                                       load_time=0, failure_rate=0.5)
+    failing_backend.start()
+    failures = asyncio.run(run_failing(LlamaClient(failing_backend)))
+    print(f"Failed requests with 50% injected failures: {failures}/{REQUESTS}")
+    failing_backend.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# This script checks that encode_image of m02_printer_data_formatter
+# produces the same print job, byte for byte, as the per-pixel encoder it
+# replaced, and compares their speed. It encodes generated sample images:
+# RGB and grayscale, portrait and landscape, at the printer width and at
+# widths that aren't a multiple of 8. It exits with an error if any
+# encoding differs.
+
+#! /usr/bin/python3
+
+"""
+Modules:
+    random
+    sys
+    time
+    PIL.Image
+    PIL.ImageDraw
+    m02_printer_data_formatter
+"""
+
+import random
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+from m02_printer_data_formatter import encode_image
+
+# (name, mode, width, height) of the sample images
+SAMPLE_IMAGES = [
+    ("RGB portrait", "RGB", 600, 900),
+    ("grayscale portrait", "L", 500, 800),
+    ("RGB landscape", "RGB", 900, 400),
+    ("native width", "L", 384, 700),
+    ("383 dots wide", "L", 383, 600),
+    ("1-bit native width", "1", 384, 300),
+]
+
+def reference_encode(image):
+    """The encoder before encode_image, one pixel at a time"""
+    if image.width > image.height:
+        image = image.rotate(90, expand=True)
+
+    # width 384 dots
+    image = image.resize(size=(384, int(image.height * 384 / image.width)))
+
+    # black&white printer: dithering
+    image = image.convert(mode='1')
+
+    data = bytearray(b'\x1b\x40\x1b\x61\x01\x1f\x11\x02\x04')
+    remaining = image.height
+    line = 0
+    while remaining > 0:
+        lines = min(remaining, 256)
+        data += 0x761d.to_bytes(2, 'little')
+        data += 0x0030.to_bytes(2, 'little')
+        data += 0x0030.to_bytes(2, 'little')
+        data += (lines - 1).to_bytes(2, 'little')
+        remaining -= lines
+        while lines > 0:
+            for x in range(int(image.width / 8)):
+                byte = 0
+                for bit in range(8):
+                    if image.getpixel((x * 8 + bit, line)) == 0:
+                        byte |= 1 << (7 - bit)
+                # 0x0a breaks the rendering
+                # 0x0a alone is processed like LineFeed by the printer
+                if byte == 0x0a:
+                    byte = 0x14
+                data += byte.to_bytes(1, 'little')
+            lines -= 1
+            line += 1
+    data += (b'\x1b\x64\x02'
+             b'\x1b\x64\x02'
+             b'\x1f\x11\x08'
+             b'\x1f\x11\x0e'
+             b'\x1f\x11\x07'
+             b'\x1f\x11\x09')
+    return bytes(data)
+
+def sample_image(mode, width, height, seed):
+    """Return an image with gradients, shapes and noise to dither"""
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(20):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(1, width // 2), y0 + rng.randrange(1, height // 2)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+        else:
+            draw.rectangle((x0, y0, x1, y1), outline=color, width=rng.randrange(1, 6))
+    for _ in range(width * height // 50):
+        image.putpixel((rng.randrange(width), rng.randrange(height)),
+                       tuple(rng.randrange(256) for _ in range(3)))
+    return image.convert(mode)
+
+def main():
+    """Main function"""
+    failures = 0
+    for seed, (name, mode, width, height) in enumerate(SAMPLE_IMAGES):
+        image = sample_image(mode, width, height, seed)
+
+        started = time.perf_counter()
+        expected = reference_encode(image)
+        reference_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        data = encode_image(image)
+        encode_time = time.perf_counter() - started
+
+        same = data == expected
+        failures += not same
+        print(f"{name:<20} {len(data):7d} bytes  {'same' if same else 'DIFFERENT':<9} "
+              f"per pixel {reference_time * 1000:8.1f} ms  "
+              f"encode_image {encode_time * 1000:6.1f} ms")
+
+    if failures:
+        print(f"{failures} of {len(SAMPLE_IMAGES)} images encoded differently")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# This script compares the size of the print jobs of a few sample poems
+# between the fixed size layout and the layout fitted to the text,
+# with and without blank rows sent as paper feeds.
+
+#! /usr/bin/python3
+
+"""
+Modules:
+    sys
+    time
+    poem_renderer
+    m02_printer_data_formatter
+"""
+
+import sys
+import time
+
+import poem_renderer
+from poem_renderer import generate_image_from_text
+from m02_printer_data_formatter import encode_raster
+
+FONT = "fonts/CrimsonPro-Regular.ttf"
+
+SAMPLE_POEMS = [
+    "A toaster wakes with a cheerful ding,\n"
+    "Golden bread and a morning to sing,\n"
+    "The crumbs all dance across the floor,\n"
+    "Breakfast smiles like never before,\n"
+    "Hope pops up with a springy spring.",
+
+    "Tomorrow the rain will softly fall,\n"
+    "And you will dance outside through it all,\n"
+    "Puddles splash beneath your feet,\n"
+    "Strangers laugh along the street,\n"
+    "Joy will answer every call.",
+
+    "A cookie waits inside your bag,\n"
+    "Smashed to crumbs but not a drag,\n"
+    "On the train you find your treat,\n"
+    "A little gift, a crumbly sweet,\n"
+    "Your hungry heart will wave its flag.",
+]
+
+LAYOUTS = [
+    ("fixed", False, False),
+    ("fixed + feeds", False, True),
+    ("fitted", True, False),
+    ("fitted + feeds", True, True),
+]
+
+def main():
+    """Main function"""
+    font_path = sys.argv[1] if len(sys.argv) > 1 else FONT
+    poem_renderer.DEBUG = False
+
+    totals = {name: 0 for name, _, _ in LAYOUTS}
+    for index, poem in enumerate(SAMPLE_POEMS):
+        for name, fit_to_content, feed_blank_rows in LAYOUTS:
+            started = time.perf_counter()
+            image = generate_image_from_text(poem, font_path, fit_to_content=fit_to_content)
+            data = encode_raster(image, feed_blank_rows=feed_blank_rows)
+            elapsed = time.perf_counter() - started
+            totals[name] += len(data)
+            print(f"poem {index}: {name:<15} {image.height:4d} rows "
+                  f"{len(data):6d} bytes {elapsed * 1000:7.2f} ms")
+
+    baseline = totals[LAYOUTS[0][0]]
+    print()
+    for name, total in totals.items():
+        print(f"{name:<15} {total:7d} bytes ({total / baseline:.0%} of fixed)")
+
+if __name__ == "__main__":
+    main()
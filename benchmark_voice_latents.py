@@ -0,0 +1,73 @@
+# This script measures the time to synthesize a line of the cloned voice
+# with TTS.tts_to_file(speaker_wav=...), which computes the conditioning
+# latents of the reference audio for every line, and with the latents
+# cached by voice_latents.
+
+#! /usr/bin/python3
+
+"""
+Modules:
+    os
+    statistics
+    tempfile
+    time
+    TTS: TTS API
+    voice_latents
+"""
+
+import os
+import statistics
+import tempfile
+import time
+
+from TTS.api import TTS
+
+import voice_latents
+from voice_latents import get_conditioning_latents, synthesize_to_file
+
+SPEAKER_WAV = "tts/voice-cloning/ref.wav"
+LANGUAGE = "en"
+
+LINES = [
+    "Discover your future with a joyful poem! Step right up!",
+    "Let a happy verse reveal what lies ahead for you!",
+    "A toaster wakes with a cheerful ding, golden bread and a morning to sing.",
+    "May the wisdom of the reading guide you and the light of the future inspire you.",
+]
+
+def time_lines(synthesize, folder):
+    """Return the seconds taken to synthesize each of LINES"""
+    times = []
+    for idx, text in enumerate(LINES):
+        started = time.perf_counter()
+        synthesize(text, os.path.join(folder, f"output_{idx}.wav"))
+        times.append(time.perf_counter() - started)
+    return times
+
+def main():
+    """Main function"""
+    tts = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to("cpu")
+    voice_latents.DEBUG = False
+
+    with tempfile.TemporaryDirectory() as folder:
+        uncached = time_lines(
+            lambda text, file_path: tts.tts_to_file(text, speaker_wav=SPEAKER_WAV,
+                                                    language=LANGUAGE, file_path=file_path),
+            folder)
+
+        started = time.perf_counter()
+        get_conditioning_latents(tts, SPEAKER_WAV)
+        first_call = time.perf_counter() - started
+
+        cached = time_lines(
+            lambda text, file_path: synthesize_to_file(tts, text, SPEAKER_WAV,
+                                                       LANGUAGE, file_path),
+            folder)
+
+    print(f"Latents computed or loaded in {first_call:.2f}s")
+    print(f"speaker_wav per line    {statistics.mean(uncached):6.2f}s")
+    print(f"cached latents per line {statistics.mean(cached):6.2f}s")
+    print(f"Saved per line          {statistics.mean(uncached) - statistics.mean(cached):6.2f}s")
+
+if __name__ == "__main__":
+    main()
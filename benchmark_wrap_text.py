@@ -0,0 +1,96 @@
+# This script checks that the cached wrap_text in poem_renderer breaks the
+# lines exactly like the original implementation, and compares their speed
+# over the sample poems wrapped at a few widths.
+
+#! /usr/bin/python3
+
+"""
+Modules:
+    sys
+    time
+    PIL.ImageFont
+    poem_renderer
+"""
+
+import sys
+import time
+
+from PIL import ImageFont
+
+from poem_renderer import FONT_SIZE, word_widths_cache, wrap_text
+from benchmark_print_payload import FONT, SAMPLE_POEMS
+
+# Poems in the style of the ones generated from POEM_TOPICS
+POEM_CORPUS = SAMPLE_POEMS + [
+    "In Neukölln a door swings wide,\n"
+    "An affordable flat with light inside,\n"
+    "The landlord smiles and hands the key,\n"
+    "A balcony for you and me,\n"
+    "Your search is over, joy your guide.",
+
+    "Your boss is sitting in the sauna steam,\n"
+    "Red-faced and laughing, or so it would seem,\n"
+    "You share a joke about the weekly meeting,\n"
+    "The awkward silence is quickly retreating,\n"
+    "And Monday feels like a sweaty dream.",
+
+    "A dream will whisper what you need to know,\n"
+    "Through moonlit fields where the sunflowers grow,\n"
+    "You'll wake with answers bright and clear,\n"
+    "The path ahead will suddenly appear,\n"
+    "And off into your day you'll go.",
+]
+
+WIDTHS = [120, 200, 280, 354]
+
+REPEATS = 20
+
+def wrap_text_reference(text, font, max_width):
+    """Original wrap_text, measuring the whole line for every word"""
+    lines = text.split("\n")
+    wrapped_lines = []
+    for line in lines:
+        words = line.split()
+        wrapped_line = ""
+        for word in words:
+            wrapped_line_test = wrapped_line + word + " "
+            wrapped_line_test_bbox = font.getbbox(wrapped_line_test)
+            if wrapped_line_test_bbox[2] <= max_width:
+                wrapped_line = wrapped_line_test
+            else:
+                wrapped_lines.append(wrapped_line)
+                wrapped_line = word + " "
+        wrapped_lines.append(wrapped_line)
+    return "\n".join(wrapped_lines)
+
+def time_wrap(wrap, font):
+    """Return the seconds taken to wrap the corpus REPEATS times"""
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        for poem in POEM_CORPUS:
+            for width in WIDTHS:
+                wrap(poem, font, width)
+    return time.perf_counter() - started
+
+def main():
+    """Main function"""
+    font_path = sys.argv[1] if len(sys.argv) > 1 else FONT
+    font = ImageFont.truetype(font_path, FONT_SIZE)
+
+    mismatches = 0
+    for poem in POEM_CORPUS:
+        for width in WIDTHS:
+            if wrap_text(poem, font, width) != wrap_text_reference(poem, font, width):
+                mismatches += 1
+                print(f"Different line breaks at width {width}:\n{poem}\n")
+    print("Mismatches:", mismatches)
+
+    reference = time_wrap(wrap_text_reference, font)
+    word_widths_cache.clear()
+    cached = time_wrap(wrap_text, font)
+    wraps = REPEATS * len(POEM_CORPUS) * len(WIDTHS)
+    print(f"reference: {reference / wraps * 1e6:8.1f} us per poem")
+    print(f"cached:    {cached / wraps * 1e6:8.1f} us per poem ({reference / cached:.1f}x)")
+
+if __name__ == "__main__":
+    main()
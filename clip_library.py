@@ -0,0 +1,267 @@
+# Library of the speech clips generated while idle.
+
+# Every clip is recorded in a JSON index next to the clips, with its
+# duration, topic, creation time and play count, so the idle flow can pick
+# clips without listing the folder. The library is bounded: once it holds
+# more than MAX_CLIPS clips or MAX_BYTES bytes, the least recently used
+# clips are deleted, a clip never played counting as used when created.
+# Clip IDs come from a counter saved in the index, and every ID is reserved
+# by creating its clip file exclusively, so generators never get the same
+# file, even from different processes. Every save merges the index saved
+# by the other processes, under a lock file, so no process loses the clips
+# of another. Picks come from a shuffle bag and are counted in memory, and
+# flush() writes the play counts to the index.
+
+"""
+Modules:
+    contextlib
+    fcntl: Lock of the index shared by the processes
+    json
+    os
+    threading
+    time
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import threading
+import time
+
+from audio_catalog import ShuffleBag, get_wav_duration
+
+DEBUG = True
+
+CLIPS_FOLDER = "tts/idle/generated"
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+
+# Bounds of the library, the clips beyond them are evicted
+MAX_CLIPS = 50
+MAX_BYTES = 200 * 1024 * 1024
+
+# Seconds after which a clip allocated but never added is deleted. Younger
+# ones may still be written by a generator in another process.
+ORPHAN_AGE = 60 * 60
+
+class ClipLibrary:
+    """Bounded, indexed folder of speech clips.
+
+    A generator calls allocate() to get the path of a new clip, then add()
+    once it is written, or discard() if it failed. Clips allocated but not
+    added yet are never picked, and are deleted at a later start if they
+    were never added.
+    """
+    def __init__(self, folder=CLIPS_FOLDER, max_clips=MAX_CLIPS, max_bytes=MAX_BYTES):
+        self.folder = folder
+        self.index_file = os.path.join(folder, INDEX_FILE)
+        self.lock_file = os.path.join(folder, LOCK_FILE)
+        self.max_clips = max_clips
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.clips = {}
+        self.next_id = 1
+        self.bag = ShuffleBag()
+        # Play counts changed since the index was saved
+        self.dirty = False
+
+        os.makedirs(folder, exist_ok=True)
+        self.load()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.clips)
+
+    def clip_path(self, clip_id):
+        return os.path.join(self.folder, f"clip-{clip_id}.wav")
+
+    def load(self):
+        """Load the index, or build it from the clips in the folder"""
+        try:
+            self.clips, self.next_id = self.read_index()
+        except FileNotFoundError:
+            self.adopt_clips()
+            return
+        except (OSError, ValueError) as e:
+            print(f"Error loading the clip index, rebuilding it: {e}")
+            self.adopt_clips()
+            return
+
+        # Forget the clips deleted by hand
+        missing = [clip_id for clip_id, clip in self.clips.items()
+                   if not os.path.exists(clip["file"])]
+        for clip_id in missing:
+            del self.clips[clip_id]
+        if missing:
+            self.save()
+        self.bag.update(self.clips)
+
+        # Delete the clips of generations interrupted before add()
+        indexed = {clip["file"] for clip in self.clips.values()}
+        for file_name in os.listdir(self.folder):
+            file_path = os.path.join(self.folder, file_name)
+            if file_name.startswith("clip-") and file_name.endswith(".wav") and file_path not in indexed:
+                try:
+                    if time.time() - os.path.getmtime(file_path) > ORPHAN_AGE:
+                        os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+
+        if DEBUG:
+            print(f"Loaded {len(self.clips)} clips into the clip library")
+
+    def adopt_clips(self):
+        """Index the clips found in the folder, generated before the index"""
+        self.clips = {}
+        file_names = sorted(f for f in os.listdir(self.folder) if f.endswith(".wav"))
+        for clip_id, file_name in enumerate(file_names, start=1):
+            file_path = os.path.join(self.folder, file_name)
+            self.clips[clip_id] = {
+                "file": file_path, "topic": None,
+                "duration": get_wav_duration(file_path),
+                "bytes": os.path.getsize(file_path),
+                "created": os.path.getmtime(file_path),
+                "plays": 0, "last_played": None}
+        self.next_id = len(file_names) + 1
+        with self.lock:
+            self.save()
+
+        if DEBUG:
+            print(f"Indexed {len(self.clips)} clips into the clip library")
+
+    def read_index(self):
+        """Return the clips and the next ID saved in the index, by any process"""
+        with open(self.index_file, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        clips = {int(clip_id): clip for clip_id, clip in data.get("clips", {}).items()}
+        return clips, data.get("next_id", 1)
+
+    @contextlib.contextmanager
+    def index_lock(self):
+        """Hold the lock of the index shared by the processes"""
+        with open(self.lock_file, "a", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def merge_index(self):
+        """Merge the index saved by the other processes, holding both locks"""
+        try:
+            saved_clips, saved_next_id = self.read_index()
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Error reading the clip index, overwriting it: {e}")
+            return
+
+        for clip_id, saved in saved_clips.items():
+            clip = self.clips.get(clip_id)
+            if clip is None:
+                self.clips[clip_id] = saved
+                continue
+            clip["plays"] = max(clip["plays"], saved["plays"])
+            clip["last_played"] = max(clip["last_played"] or 0, saved["last_played"] or 0) or None
+        self.next_id = max(self.next_id, saved_next_id)
+
+        # Forget the clips deleted by other processes, or by hand
+        for clip_id in [clip_id for clip_id, clip in self.clips.items()
+                        if not os.path.exists(clip["file"])]:
+            del self.clips[clip_id]
+
+    def save(self):
+        """Merge and write the index to disk atomically, holding the lock"""
+        with self.index_lock():
+            self.write_index()
+
+    def write_index(self):
+        """Merge and write the index, holding both locks"""
+        self.merge_index()
+        self.evict()
+        self.bag.update(self.clips)
+        self.dirty = False
+        # Generators in other processes may save the index at once
+        temp_path = f"{self.index_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump({"next_id": self.next_id, "clips": self.clips}, file)
+            os.replace(temp_path, self.index_file)
+        except OSError as e:
+            print(f"Error saving the clip index: {e}")
+
+    def allocate(self):
+        """Reserve a new clip, returning its ID and the path to write it to.
+
+        The clip file is created empty with O_EXCL, so an ID taken by a
+        generator in another process is skipped.
+        """
+        with self.lock, self.index_lock():
+            self.merge_index()
+            clip_id = self.next_id
+            while True:
+                try:
+                    os.close(os.open(self.clip_path(clip_id),
+                                     os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                    break
+                except FileExistsError:
+                    clip_id += 1
+            self.next_id = clip_id + 1
+            # Saved now, so the ID isn't handed out again after a restart
+            self.write_index()
+        return clip_id, self.clip_path(clip_id)
+
+    def add(self, clip_id, topic=None, duration=None):
+        """Add a clip written to the path given by allocate()"""
+        file_path = self.clip_path(clip_id)
+        if duration is None:
+            duration = get_wav_duration(file_path)
+        with self.lock:
+            self.clips[clip_id] = {
+                "file": file_path, "topic": topic, "duration": duration,
+                "bytes": os.path.getsize(file_path), "created": time.time(),
+                "plays": 0, "last_played": None}
+            self.save()
+
+    def discard(self, clip_id):
+        """Give up a clip that couldn't be generated"""
+        try:
+            os.remove(self.clip_path(clip_id))
+        except FileNotFoundError:
+            pass
+
+    def pick(self):
+        """Return the path of the next clip and count its play, None if there is none"""
+        with self.lock:
+            clip_id = self.bag.pick()
+            if clip_id is None:
+                return None
+            clip = self.clips[clip_id]
+            clip["plays"] += 1
+            clip["last_played"] = time.time()
+            self.dirty = True
+            return clip["file"]
+
+    def flush(self):
+        """Save the play counts counted since the index was last saved"""
+        with self.lock:
+            if self.dirty:
+                self.save()
+
+    def evict(self):
+        """Delete the least recently used clips beyond the bounds, holding the lock"""
+        total_bytes = sum(clip["bytes"] for clip in self.clips.values())
+        order = sorted(self.clips, key=lambda clip_id: (
+            self.clips[clip_id]["last_played"] or self.clips[clip_id]["created"]))
+        for clip_id in order:
+            if len(self.clips) <= self.max_clips and total_bytes <= self.max_bytes:
+                break
+            clip = self.clips.pop(clip_id)
+            total_bytes -= clip["bytes"]
+            try:
+                os.remove(clip["file"])
+            except FileNotFoundError:
+                pass
+            if DEBUG:
+                print(f"Evicted {clip['file']} from the clip library, played {clip['plays']} times")
@@ -0,0 +1,263 @@
+# Deterministic stand-in for the Ollama server.
+
+# It answers /api/generate with the same streamed JSON lines as Ollama,
+# picking one of a few canned poems for every prompt, so the poem pipeline
+# can be run and benchmarked without LLAMA3. The token rate, the latency
+# and the rate of failed requests can be set.
+# Run it as a script to serve on the Ollama port, or use FakeLlamaBackend
+# to serve it from a thread of the program.
+
+#! /usr/bin/python3
+
+"""
+Modules:
+    argparse
+    hashlib
+    json
+    random
+    threading
+    time
+    http.server
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_client import LlamaBackend, MODEL
+
+DEBUG = True
+
+PORT = 11434
+
+POEMS = [
+    "A toaster wakes with a cheerful ding,\n"
+    "Golden bread and a morning to sing,\n"
+    "The crumbs all dance across the floor,\n"
+    "Breakfast smiles like never before,\n"
+    "Hope pops up with a springy spring.",
+
+    "Tomorrow the rain will softly fall,\n"
+    "And you will dance outside through it all,\n"
+    "Puddles splash beneath your feet,\n"
+    "Strangers laugh along the street,\n"
+    "Joy will answer every call.",
+
+    "A cookie waits inside your bag,\n"
+    "Smashed to crumbs but not a drag,\n"
+    "On the train you find your treat,\n"
+    "A little gift, a crumbly sweet,\n"
+    "Your hungry heart will wave its flag.",
+
+    "A dream will whisper what you need to know,\n"
+    "Through moonlit fields where the sunflowers grow,\n"
+    "You'll wake with answers bright and clear,\n"
+    "The path ahead will suddenly appear,\n"
+    "And off into your day you'll go.",
+]
+
+# Tokens streamed per second
+TOKEN_RATE = 20.0
+
+# Seconds before the first token
+LATENCY = 0.5
+
+# Seconds to load the model on the first request
+LOAD_TIME = 2.0
+
+# Share of the requests that fail, half with an error status and
+# half by dropping the connection in the middle of the stream
+FAILURE_RATE = 0.0
+
+def tokenize(text):
+    """Split text into tokens of a word and the spacing before it"""
+    tokens = []
+    token = ""
+    for char in text:
+        if token and char in " \n" and not token.isspace():
+            tokens.append(token)
+            token = ""
+        token += char
+    if token:
+        tokens.append(token)
+    return tokens
+
+class FakeLlamaServer(ThreadingHTTPServer):
+    """HTTP server answering /api/generate like Ollama"""
+    daemon_threads = True
+
+    def __init__(self, port=PORT, token_rate=TOKEN_RATE, latency=LATENCY,
+                 load_time=LOAD_TIME, failure_rate=FAILURE_RATE, seed=0):
+        super().__init__(("127.0.0.1", port), FakeLlamaHandler)
+        self.token_rate = token_rate
+        self.latency = latency
+        self.load_time = load_time
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.model_loaded = False
+
+    def should_fail(self):
+        """Return None, "status" or "drop" for the next request"""
+        with self.random_lock:
+            if self.random.random() >= self.failure_rate:
+                return None
+            return self.random.choice(["status", "drop"])
+
+    def load_model(self):
+        """Return the seconds spent loading the model for a request"""
+        if self.model_loaded:
+            return 0.0
+        time.sleep(self.load_time)
+        self.model_loaded = True
+        return self.load_time
+
+class FakeLlamaHandler(BaseHTTPRequestHandler):
+    """Handler of the requests to the fake server"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if DEBUG:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        except (TypeError, ValueError):
+            self.send_error(400)
+            return
+
+        failure = self.server.should_fail()
+        if failure == "status":
+            self.send_error(500, "Injected failure")
+            return
+
+        started = time.perf_counter()
+        load_time = self.server.load_model()
+        model = request.get("model", MODEL)
+        prompt = request.get("prompt", "")
+
+        # An empty prompt only loads the model
+        if not prompt:
+            self.send_json({"model": model, "response": "", "done": True,
+                            "load_duration": int(load_time * 1e9)})
+            return
+
+        # The same prompt always gets the same poem
+        digest = hashlib.sha1(prompt.encode("utf-8")).digest()
+        poem = POEMS[digest[0] % len(POEMS)]
+        tokens = tokenize(poem)
+        num_predict = request.get("options", {}).get("num_predict")
+        if num_predict:
+            tokens = tokens[:num_predict]
+
+        if not request.get("stream", True):
+            time.sleep(self.server.latency + len(tokens) / self.server.token_rate)
+            self.send_json({"model": model, "response": "".join(tokens), "done": True,
+                            "load_duration": int(load_time * 1e9),
+                            "eval_count": len(tokens)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(self.server.latency)
+        eval_started = time.perf_counter()
+        try:
+            for index, token in enumerate(tokens):
+                if failure == "drop" and index == len(tokens) // 2:
+                    # Close the connection without ending the stream
+                    self.close_connection = True
+                    return
+                self.send_chunk({"model": model, "response": token, "done": False})
+                time.sleep(1 / self.server.token_rate)
+
+            eval_time = time.perf_counter() - eval_started
+            self.send_chunk({"model": model, "response": "", "done": True,
+                             "total_duration": int((time.perf_counter() - started) * 1e9),
+                             "load_duration": int(load_time * 1e9),
+                             "eval_count": len(tokens),
+                             "eval_duration": int(eval_time * 1e9)})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the generation or timed out
+            if DEBUG:
+                print("Fake LLAMA3 client closed the connection in the middle of the stream")
+            self.close_connection = True
+
+    def send_json(self, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, obj):
+        line = json.dumps(obj).encode("utf-8") + b"\n"
+        self.wfile.write(b"%x\r\n" % len(line) + line + b"\r\n")
+        self.wfile.flush()
+
+class FakeLlamaBackend(LlamaBackend):
+    """Fake LLAMA3 API served from a thread of this program"""
+    def __init__(self, port=0, **server_options):
+        self.port = port
+        self.server_options = server_options
+        self.server = None
+        self.thread = None
+
+    @property
+    def api_endpoint(self):
+        return f"http://127.0.0.1:{self.port}/api/generate"
+
+    def start(self):
+        if self.server is not None:
+            return
+        self.server = FakeLlamaServer(self.port, **self.server_options)
+        # Port 0 picks a free port
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        if DEBUG:
+            print("Fake LLAMA3 API serving on", self.api_endpoint)
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.server = None
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Fake LLAMA3 API server")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--token-rate", type=float, default=TOKEN_RATE)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    parser.add_argument("--load-time", type=float, default=LOAD_TIME)
+    parser.add_argument("--failure-rate", type=float, default=FAILURE_RATE)
+    args = parser.parse_args()
+
+    server = FakeLlamaServer(args.port, token_rate=args.token_rate, latency=args.latency,
+                             load_time=args.load_time, failure_rate=args.failure_rate)
+    print(f"Fake LLAMA3 API serving on http://127.0.0.1:{args.port}/api/generate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Exiting...")
+    server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -3,17 +3,14 @@
 
 """
 Modules :
-1. TTS - TTS API
+1. tts_assets - Incremental builder of the TTS audio
 """
 
-from TTS.api import TTS
+from tts_assets import build_assets
 
 # Get DEVICE
 DEVICE = "cpu"
 
-# Init TTS
-TTS = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to(DEVICE)
-
 TEXT_ARRAY = [
   "May the wisdom of the reading guide you and the light of the future inspire you.",
   "You face the chaos, seeking wisdom’s glow, the omens will guide, let’s see where you’ll go."
@@ -21,10 +18,9 @@ TEXT_ARRAY = [
 
 def generate_speech(text_array):
     """Function to generate prerecorded TTS for the given text array"""
-    for idx, text in enumerate(text_array):
-        TTS.tts_to_file(text, speaker_wav="tts/voice-cloning/ref.wav", language="en", file_path=f"tts/pre-recorded/idle/output_{idx}.wav")
-
-    print("Audio saved as output_*.wav")
+    # Only the changed texts are synthesized, and the files
+    # of the removed ones are deleted
+    build_assets(text_array, "tts/pre-recorded/idle", device=DEVICE)
 
 def main():
     """Main function"""
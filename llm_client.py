@@ -0,0 +1,472 @@
+# Client side of the LLAMA3 API used to generate the poems.
+
+# The API streams its answer as one JSON object per line. PoemStream turns
+# that stream into events as soon as they arrive: every token, and every
+# complete line of the poem, so text-to-speech, layout or logging can start
+# before the whole poem is generated.
+# LlamaClient keeps a pool of connections to the API, asks it to keep the
+# model loaded, and pings it while idle so the model stays in memory.
+# It can also stream a poem on asyncio streams, so the interaction flow can
+# await it, run several at once and cancel it when it takes too long.
+
+"""
+Modules:
+    asyncio
+    json
+    re
+    threading
+    time
+    urllib.parse
+    requests: HTTP requests
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEBUG = True
+
+API_ENDPOINT = "http://localhost:11434/api/generate"
+MODEL = "llama3"
+
+# How long the API keeps the model loaded after a request
+KEEP_ALIVE = "30m"
+
+# Seconds without requests after which the model is pinged to keep it warm,
+# shorter than KEEP_ALIVE
+KEEP_WARM_INTERVAL = 10 * 60
+
+REQUEST_TIMEOUT = 100
+
+# Seconds of model load time above which a request counts as a cold start
+COLD_LOAD_TIME = 1.0
+
+# Number of latencies kept for monitoring
+MAX_LATENCIES = 100
+
+# Number of lines of a poem
+POEM_LINES = 5
+
+# Options that make the API reload the model when they change. They are
+# shared by all the profiles and the warm-up, so the model stays loaded
+# when switching profiles. The prompt and a 5 line poem fit in a small
+# context, which keeps the KV cache small. num_thread is left to the API,
+# which only uses the performance cores.
+RUNNER_OPTIONS = {
+    "num_ctx": 512,
+}
+
+# Stop sequences that end the poem before the model starts commenting it.
+# The comments follow a blank line, so the words alone don't stop a poem
+# line that contains them.
+POEM_STOP = ["\n\n\n", "\n\nI hope", "\n\nNote:", "\n\nLet me know"]
+
+# Lines around the poem, such as "Here is a poem about ...:", a
+# "**Title**" or a closing "Enjoy!"
+INTRO_PATTERN = re.compile(r"^(here is|here's|title:|#)|:$|^\*\*.*\*\*$", re.IGNORECASE)
+OUTRO_PATTERN = re.compile(r"^(i hope|note:|let me know|enjoy)", re.IGNORECASE)
+
+# Generation options by kind of text
+GENERATION_PROFILES = {
+    # Poem printed for a visitor
+    "poem": {
+        **RUNNER_OPTIONS,
+        "num_predict": 120,
+        "temperature": 0.8,
+        "stop": POEM_STOP,
+    },
+    # Fortune lines spoken while idle
+    "fortune teller": {
+        **RUNNER_OPTIONS,
+        "num_predict": 120,
+        "temperature": 1.0,
+        "stop": POEM_STOP,
+    },
+}
+
+def check_poem_lines(poem, lines=POEM_LINES):
+    """Return the lines of a poem, or None if it has fewer lines"""
+    poem_lines = [line.strip() for line in poem.strip().split("\n") if line.strip()]
+    # Drop the title, introduction and closing comment around the poem
+    while len(poem_lines) > lines and INTRO_PATTERN.search(poem_lines[0]):
+        poem_lines = poem_lines[1:]
+    while len(poem_lines) > lines and OUTRO_PATTERN.search(poem_lines[-1]):
+        poem_lines = poem_lines[:-1]
+    if len(poem_lines) < lines:
+        if DEBUG:
+            print(f"Poem has {len(poem_lines)} lines instead of {lines}")
+        return None
+    # Anything else left before the poem is an unknown title or introduction
+    if len(poem_lines) > lines and DEBUG:
+        print(f"Poem has {len(poem_lines)} lines, keeping the last {lines}")
+    return "\n".join(poem_lines[-lines:])
+
+class LlamaError(Exception):
+    """Raised when the LLAMA3 API answers with an error"""
+
+async def read_chunked(reader):
+    """Yield the chunks of a chunked HTTP response body"""
+    while True:
+        size_line = await reader.readline()
+        if not size_line:
+            raise LlamaError("LLAMA3 API closed the connection in the middle of the response")
+        try:
+            size = int(size_line.split(b";")[0].strip(), 16)
+        except ValueError as e:
+            raise LlamaError(f"LLAMA3 API sent a malformed chunk size {size_line!r}") from e
+        if size == 0:
+            return
+        try:
+            yield await reader.readexactly(size)
+            # CRLF after every chunk
+            await reader.readexactly(2)
+        except asyncio.IncompleteReadError as e:
+            raise LlamaError("LLAMA3 API closed the connection in the middle of a chunk") from e
+
+async def read_lines(reader, writer, chunked):
+    """Yield the lines of an HTTP response body, closing the connection at the end"""
+    try:
+        if not chunked:
+            async for line in reader:
+                yield line
+            return
+
+        buffer = b""
+        async for chunk in read_chunked(reader):
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line
+        if buffer:
+            yield buffer
+    finally:
+        writer.close()
+
+class StreamEvent:
+    """Kinds of events of a poem stream"""
+    TOKEN = "token"
+    LINE = "line"
+    DONE = "done"
+
+class PoemStream:
+    """Incremental parser of a streamed LLAMA3 API response.
+
+    Iterating over the stream yields (kind, text) events: a TOKEN for every
+    piece of text, a LINE for every complete line, and a single DONE with
+    the whole text at the end. lines can be an iterable or, with async for,
+    an asynchronous iterable. Callbacks added with subscribe() are called
+    with the text of the events of their kind as they are parsed.
+    """
+    def __init__(self, lines, started=None):
+        self.lines = lines
+        self.started = started if started is not None else time.perf_counter()
+        self.subscribers = {StreamEvent.TOKEN: [], StreamEvent.LINE: [], StreamEvent.DONE: []}
+        self.text = ""
+        self.parts = []
+        self.pending_line = ""
+        self.stats = {}
+        self.time_to_first_token = None
+        self.time_to_first_line = None
+        self.time_to_complete = None
+
+    def subscribe(self, kind, callback):
+        """Call callback with the text of every event of the given kind"""
+        self.subscribers[kind].append(callback)
+
+    def __iter__(self):
+        # The lines are read to the end even after the last object, so the
+        # connection is left ready to be reused or closed cleanly
+        for line in self.lines:
+            yield from self.parse_line(line)
+        yield from self.finish()
+
+    async def __aiter__(self):
+        async for line in self.lines:
+            for event in self.parse_line(line):
+                yield event
+        for event in self.finish():
+            yield event
+
+    def parse_line(self, line):
+        """Return the events of a line of the response"""
+        events = []
+        if not line:
+            return events
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        json_obj = json.loads(line)
+        token = json_obj.get("response")
+        if token:
+            if self.time_to_first_token is None:
+                self.time_to_first_token = self.elapsed()
+            self.parts.append(token)
+            events.append(self.emit(StreamEvent.TOKEN, token))
+
+            self.pending_line += token
+            while "\n" in self.pending_line:
+                complete_line, self.pending_line = self.pending_line.split("\n", 1)
+                if complete_line.strip():
+                    events.append(self.emit_line(complete_line))
+        if json_obj.get("done"):
+            # The last object has the timings of the generation
+            self.stats = json_obj
+        return events
+
+    def finish(self):
+        """Return the events at the end of the response"""
+        events = []
+        if self.pending_line.strip():
+            events.append(self.emit_line(self.pending_line))
+            self.pending_line = ""
+
+        self.text = "".join(self.parts)
+        self.time_to_complete = self.elapsed()
+        if DEBUG:
+            print(f"Poem streamed: first token {self.format_time(self.time_to_first_token)}, "
+                  f"first line {self.format_time(self.time_to_first_line)}, "
+                  f"complete {self.format_time(self.time_to_complete)}")
+        events.append(self.emit(StreamEvent.DONE, self.text))
+        return events
+
+    def read(self):
+        """Consume the whole stream and return the text"""
+        for _ in self:
+            pass
+        return self.text
+
+    async def read_async(self):
+        """Consume the whole asynchronous stream and return the text"""
+        async for _ in self:
+            pass
+        return self.text
+
+    def elapsed(self):
+        """Seconds since the request was started"""
+        return time.perf_counter() - self.started
+
+    def emit_line(self, line):
+        if self.time_to_first_line is None:
+            self.time_to_first_line = self.elapsed()
+        return self.emit(StreamEvent.LINE, line)
+
+    def emit(self, kind, text):
+        for callback in self.subscribers[kind]:
+            try:
+                callback(text)
+            except Exception as e:
+                print(f"Error in poem stream {kind} subscriber: {e}")
+        return kind, text
+
+    @staticmethod
+    def format_time(seconds):
+        if seconds is None:
+            return "N/A"
+        return f"{seconds:.2f}s"
+
+class LlamaBackend:
+    """Server of the LLAMA3 API the client talks to"""
+    api_endpoint = API_ENDPOINT
+    model = MODEL
+
+    def start(self):
+        """Start serving, if the backend runs in this process"""
+
+    def stop(self):
+        """Stop serving, if the backend runs in this process"""
+
+class OllamaBackend(LlamaBackend):
+    """Ollama server running the model, started outside of this program"""
+    def __init__(self, api_endpoint=API_ENDPOINT, model=MODEL):
+        self.api_endpoint = api_endpoint
+        self.model = model
+
+class LlamaClient:
+    """Reusable client of the LLAMA3 API.
+
+    Requests share a pooled HTTP session and ask the API to keep the model
+    loaded for KEEP_ALIVE. warm_up() loads the model ahead of the first
+    poem, and the keep-warm thread repeats it while no poems are requested.
+    Cold and warm latencies are kept in latencies as (label, seconds), and
+    the tokens/s and latency of every profile in profile_stats.
+    """
+    def __init__(self, backend=None, keep_alive=KEEP_ALIVE):
+        self.backend = backend if backend is not None else OllamaBackend()
+        self.keep_alive = keep_alive
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.latencies = []
+        self.profile_stats = {profile: [] for profile in GENERATION_PROFILES}
+        self.last_request = 0.0
+        self.stop_keep_warm_event = threading.Event()
+        self.keep_warm_thread = None
+
+    @property
+    def api_endpoint(self):
+        return self.backend.api_endpoint
+
+    @property
+    def model(self):
+        return self.backend.model
+
+    def generate(self, prompt, profile="poem"):
+        """Send a prompt with the options of a profile and return the streamed response"""
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "keep_alive": self.keep_alive,
+            "options": GENERATION_PROFILES[profile],
+        }
+
+        request_started = time.perf_counter()
+        self.last_request = time.monotonic()
+        response = self.session.post(self.api_endpoint,
+                                     json=payload,
+                                     stream=True,
+                                     timeout=REQUEST_TIMEOUT)
+        # Used to time the stream from the moment the request was sent
+        response.request_started = request_started
+        response.profile = profile
+        return response
+
+    def stream(self, response):
+        """Return a stream of the response whose latency is recorded"""
+        stream = PoemStream(response.iter_lines(),
+                            started=getattr(response, "request_started", None))
+        profile = getattr(response, "profile", None)
+        stream.subscribe(StreamEvent.DONE, lambda _: self.record_stream(stream, profile))
+        return stream
+
+    async def generate_async(self, prompt, profile="poem"):
+        """Send a prompt over asyncio streams and return a stream of the response.
+
+        The stream is read with async for or read_async(). Cancelling the
+        task reading it closes the connection, which stops the generation.
+        """
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "keep_alive": self.keep_alive,
+            "options": GENERATION_PROFILES[profile],
+        }
+        body = json.dumps(payload).encode("utf-8")
+        url = urlsplit(self.api_endpoint)
+
+        request_started = time.perf_counter()
+        self.last_request = time.monotonic()
+        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        try:
+            writer.write((f"POST {url.path} HTTP/1.1\r\n"
+                          f"Host: {url.netloc}\r\n"
+                          "Content-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n"
+                          "Connection: close\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            try:
+                status = int(status_line.split()[1])
+            except (IndexError, ValueError) as e:
+                raise LlamaError(
+                    f"LLAMA3 API answered with a malformed status line {status_line!r}") from e
+            headers = {}
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip().lower()
+
+            if status != 200:
+                raise LlamaError(f"LLAMA3 API answered with status {status}")
+        except BaseException:
+            writer.close()
+            raise
+
+        chunked = headers.get("transfer-encoding") == "chunked"
+        stream = PoemStream(read_lines(reader, writer, chunked), started=request_started)
+        stream.subscribe(StreamEvent.DONE, lambda _: self.record_stream(stream, profile))
+        return stream
+
+    async def generate_text_async(self, prompt, profile="poem", timeout=None):
+        """Generate the whole text of a prompt, cancelled after timeout seconds"""
+        async def generate_text():
+            stream = await self.generate_async(prompt, profile)
+            return await stream.read_async()
+        return await asyncio.wait_for(generate_text(), timeout)
+
+    def warm_up(self):
+        """Load the model, without generating anything"""
+        started = time.perf_counter()
+        self.last_request = time.monotonic()
+        try:
+            # An empty prompt only loads the model into memory
+            response = self.session.post(self.api_endpoint,
+                                         json={"model": self.model,
+                                               "keep_alive": self.keep_alive,
+                                               "options": RUNNER_OPTIONS},
+                                         timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            load_time = response.json().get("load_duration", 0) / 1e9
+        except Exception as e:
+            print(f"Error warming up {self.model}: {e}")
+            return False
+
+        self.record_latency("cold warm-up" if load_time > COLD_LOAD_TIME else "warm-up",
+                            time.perf_counter() - started)
+        return True
+
+    def record_stream(self, stream, profile=None):
+        """Record the latency and speed of a streamed response"""
+        if stream.time_to_first_token is None:
+            return
+        load_time = stream.stats.get("load_duration", 0) / 1e9
+        self.record_latency("cold" if load_time > COLD_LOAD_TIME else "warm",
+                            stream.time_to_first_token)
+
+        if profile not in self.profile_stats:
+            return
+        eval_count = stream.stats.get("eval_count", 0)
+        eval_time = stream.stats.get("eval_duration", 0) / 1e9
+        tokens_per_second = eval_count / eval_time if eval_time > 0 else 0.0
+        stats = self.profile_stats[profile]
+        stats.append((tokens_per_second, stream.time_to_complete))
+        del stats[:-MAX_LATENCIES]
+        if DEBUG:
+            print(f"LLAMA3 {profile} profile: {eval_count} tokens, "
+                  f"{tokens_per_second:.1f} tokens/s, {stream.time_to_complete:.2f}s")
+
+    def record_latency(self, label, seconds):
+        self.latencies.append((label, seconds))
+        del self.latencies[:-MAX_LATENCIES]
+        if DEBUG:
+            print(f"LLAMA3 {label} latency: {seconds:.2f}s")
+
+    def start_keep_warm(self, interval=KEEP_WARM_INTERVAL):
+        """Start a thread that warms the model up when idle for interval seconds"""
+        if self.keep_warm_thread and self.keep_warm_thread.is_alive():
+            return
+        self.stop_keep_warm_event.clear()
+        self.keep_warm_thread = threading.Thread(target=self.keep_warm, args=(interval,))
+        self.keep_warm_thread.daemon = True
+        self.keep_warm_thread.start()
+
+    def stop_keep_warm(self):
+        """Stop the keep-warm thread"""
+        self.stop_keep_warm_event.set()
+        if self.keep_warm_thread:
+            self.keep_warm_thread.join()
+
+    def keep_warm(self, interval):
+        self.warm_up()
+        while not self.stop_keep_warm_event.is_set():
+            idle_time = time.monotonic() - self.last_request
+            if idle_time >= interval:
+                self.warm_up()
+                idle_time = 0
+            self.stop_keep_warm_event.wait(interval - idle_time)
@@ -0,0 +1,518 @@
+# Bluetooth Low Energy transport for the Phomemo M02 printer.
+
+# The formatted print job (see m02_printer_data_formatter.py) is streamed to
+# the printer in chunks sized to the negotiated MTU, using write without
+# response and an acknowledged write every few chunks as a checkpoint.
+# If a transient error happens, the transfer resumes from the last
+# acknowledged chunk.
+# PrinterSession keeps the connection to the printer open between print jobs,
+# on its own event loop thread, and reconnects in the background.
+
+#! /usr/bin/python3
+
+"""
+Modules:
+    asyncio
+    sys
+    threading
+    time
+    bleak
+    PIL.Image
+"""
+
+import asyncio
+import sys
+import threading
+import time
+
+from bleak import BleakScanner, BleakClient
+from bleak.exc import BleakError
+from PIL import Image
+
+from m02_printer_data_formatter import encode_image
+
+DEBUG = True
+
+# Default ATT MTU when the backend can't tell the negotiated one
+DEFAULT_MTU = 23
+
+# Bytes of the ATT header in every write
+ATT_HEADER_SIZE = 3
+
+# Number of chunks written without response between acknowledged writes
+CHECKPOINT_EVERY = 16
+
+# Number of times a transfer is resumed after a transient error
+MAX_RETRIES = 3
+
+# Seconds to wait before resuming after a transient error
+RETRY_DELAY = 0.5
+
+# Errors after which the transfer can be resumed
+TRANSIENT_ERRORS = (BleakError, asyncio.TimeoutError, OSError)
+
+# Bluetooth name of the printer
+PRINTER_NAME = "Mr.in_M02"
+
+# File where the last seen printer address is kept
+PRINTER_ADDRESS_FILE = "printer-address.txt"
+
+# Seconds to look for the printer before giving up
+DISCOVERY_DEADLINE = 30
+
+# Seconds of a single scan
+SCAN_TIMEOUT = 5
+
+# Seconds to wait after a failed scan, doubled after every failure
+DISCOVERY_BACKOFF = 0.5
+MAX_DISCOVERY_BACKOFF = 8
+
+# Seconds spent in every discovery, for monitoring
+discovery_times = []
+
+# Number of discovery times kept for monitoring
+MAX_LATENCIES = 100
+
+# Seconds between checks of the connection while it is up
+KEEP_ALIVE_INTERVAL = 5
+
+# Seconds to wait before reconnecting, doubled after every failed attempt
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 60
+
+# Seconds to wait for a print job to be sent
+PRINT_TIMEOUT = 60
+
+# UUID prefixes of the printer characteristics
+NOTIFY_CHAR_PREFIX = "0000ff01"
+WRITE_CHAR_PREFIX = "0000ff02"
+
+class StreamStats:
+    """Statistics of a streamed print job"""
+    def __init__(self, total_bytes, chunk_size):
+        self.total_bytes = total_bytes
+        self.chunk_size = chunk_size
+        self.acked_bytes = 0
+        self.chunks = 0
+        self.retries = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def bytes_per_second(self):
+        """Average throughput of the transfer"""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.acked_bytes / self.elapsed
+
+    def __str__(self):
+        return (f"{self.acked_bytes}/{self.total_bytes} bytes in {self.chunks} chunks "
+                f"of {self.chunk_size} bytes, {self.retries} retries, "
+                f"{self.elapsed:.2f}s, {self.bytes_per_second:.0f} bytes/s")
+
+def find_characteristics(services):
+    """Return the notify (ff01) and write (ff02) characteristics of the printer"""
+    char0 = None
+    char1 = None
+    for service in services:
+        for char in service.characteristics:
+            # char0 should start with 0000ff01
+            if char.uuid.startswith(NOTIFY_CHAR_PREFIX):
+                char0 = char
+            # char1 should start with 0000ff02
+            if char.uuid.startswith(WRITE_CHAR_PREFIX):
+                char1 = char
+    return char0, char1
+
+def get_chunk_size(client, char):
+    """Return the largest payload that fits in one write to the characteristic"""
+    chunk_size = getattr(char, "max_write_without_response_size", None)
+    if not chunk_size:
+        mtu_size = getattr(client, "mtu_size", None) or DEFAULT_MTU
+        chunk_size = mtu_size - ATT_HEADER_SIZE
+    return max(chunk_size, 1)
+
+async def stream_data(client, char, data,
+                      checkpoint_every=CHECKPOINT_EVERY,
+                      max_retries=MAX_RETRIES,
+                      progress=None):
+    """Stream data to a characteristic in MTU sized chunks"""
+    chunk_size = get_chunk_size(client, char)
+    stats = StreamStats(len(data), chunk_size)
+
+    # Offset of the first byte not yet acknowledged by the printer
+    acked = 0
+    while acked < len(data):
+        offset = acked
+        try:
+            pending = 0
+            while offset < len(data):
+                chunk = data[offset:offset + chunk_size]
+                offset += len(chunk)
+                pending += 1
+                # Acknowledge every few chunks and always the last one,
+                # so everything before it is known to have arrived
+                checkpoint = pending >= checkpoint_every or offset >= len(data)
+                await client.write_gatt_char(char, chunk, response=checkpoint)
+                stats.chunks += 1
+                if checkpoint:
+                    pending = 0
+                    acked = offset
+                    stats.acked_bytes = acked
+                    if progress:
+                        progress(acked, len(data))
+        except TRANSIENT_ERRORS as e:
+            if stats.retries >= max_retries:
+                stats.elapsed = time.perf_counter() - stats.started
+                raise
+            stats.retries += 1
+            if DEBUG:
+                print(f"Error streaming to printer at byte {offset}: {e}. "
+                      f"Resuming from byte {acked}...")
+            await asyncio.sleep(RETRY_DELAY)
+
+    stats.elapsed = time.perf_counter() - stats.started
+    if DEBUG:
+        print("Streamed to printer:", stats)
+    return stats
+
+def load_printer_address():
+    """Return the last seen printer address, if any"""
+    try:
+        with open(PRINTER_ADDRESS_FILE, "r", encoding="utf-8") as file:
+            return file.read().strip() or None
+    except OSError:
+        return None
+
+def save_printer_address(address):
+    """Remember the printer address for the next discovery"""
+    try:
+        with open(PRINTER_ADDRESS_FILE, "w", encoding="utf-8") as file:
+            file.write(address)
+    except OSError as e:
+        print(f"Error saving printer address: {e}")
+
+# Method to find the bluetooth printer device
+async def find_printer(name=PRINTER_NAME, address=None, deadline=DISCOVERY_DEADLINE):
+    """Find the printer device, returning as soon as it advertises"""
+    if address is None:
+        address = load_printer_address()
+
+    def is_printer(device, advertisement_data):
+        if address is not None and device.address == address:
+            return True
+        return name in (device.name, advertisement_data.local_name)
+
+    if DEBUG:
+        print("Scanning for Bluetooth devices...")
+    started = time.perf_counter()
+    backoff = DISCOVERY_BACKOFF
+    target_device = None
+    while True:
+        remaining = deadline - (time.perf_counter() - started)
+        if remaining <= 0:
+            break
+        target_device = await BleakScanner.find_device_by_filter(
+            is_printer, timeout=min(SCAN_TIMEOUT, remaining))
+        if target_device:
+            break
+
+        # Wait longer after every failed scan
+        remaining = deadline - (time.perf_counter() - started)
+        await asyncio.sleep(max(min(backoff, remaining), 0))
+        backoff = min(backoff * 2, MAX_DISCOVERY_BACKOFF)
+
+    elapsed = time.perf_counter() - started
+    discovery_times.append(elapsed)
+    del discovery_times[:-MAX_LATENCIES]
+
+    if not target_device:
+        if DEBUG:
+            print(f"Printer not found after {elapsed:.2f}s")
+        return None
+
+    if target_device.address != address:
+        save_printer_address(target_device.address)
+
+    if DEBUG:
+        print(f"Found the printer in {elapsed:.2f}s:", target_device)
+    return target_device
+
+class PrinterNotFoundError(Exception):
+    """Raised when the printer can't be found or connected to"""
+
+class PrinterSession:
+    """Long-lived connection to the printer.
+
+    The session runs its own event loop on a daemon thread, so the
+    connection outlives the event loops of single interactions. It caches
+    the printer address and the characteristic handles, keeps the link open
+    and reconnects with exponential backoff when it drops.
+    """
+    def __init__(self, name=PRINTER_NAME, address=None, client_class=BleakClient):
+        self.name = name
+        self.client_class = client_class
+        self.address = address or load_printer_address()
+        self.client = None
+        self.char0_handle = None
+        self.char1_handle = None
+        self.char0 = None
+        self.char1 = None
+        self.loop = None
+        self.thread = None
+        self.connect_lock = None
+        self.disconnected_event = None
+        self.stop_event = threading.Event()
+        self.reconnect_delay = RECONNECT_DELAY
+
+    @property
+    def is_connected(self):
+        """Whether the printer link is currently up"""
+        return self.client is not None and self.client.is_connected
+
+    def start(self):
+        """Start the session thread and connect in the background"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Disconnect from the printer and stop the session thread"""
+        if not self.thread:
+            return
+        self.stop_event.set()
+        future = asyncio.run_coroutine_threadsafe(self._disconnect(), self.loop)
+        try:
+            future.result(timeout=5)
+        except Exception as e:
+            print(f"Error disconnecting from the printer: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.thread = None
+
+    async def print(self, data):
+        """Send a print job through the session, from any event loop"""
+        if not self.thread:
+            self.start()
+        future = asyncio.run_coroutine_threadsafe(self._print(data), self.loop)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), PRINT_TIMEOUT)
+        except asyncio.TimeoutError as e:
+            # Still connecting, or the link dropped: the printer is off
+            # or out of range rather than the job failing
+            if not self.is_connected:
+                raise PrinterNotFoundError(
+                    f"{self.name} not connected after {PRINT_TIMEOUT}s") from e
+            raise
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.connect_lock = asyncio.Lock()
+        self.disconnected_event = asyncio.Event()
+        self.loop.create_task(self._keep_alive())
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def _keep_alive(self):
+        """Keep the printer connected, reconnecting when the link drops"""
+        while not self.stop_event.is_set():
+            try:
+                await self._connect()
+                self.reconnect_delay = RECONNECT_DELAY
+                self.disconnected_event.clear()
+                try:
+                    await asyncio.wait_for(self.disconnected_event.wait(),
+                                           KEEP_ALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            except Exception as e:
+                if DEBUG:
+                    print(f"Printer not connected: {e}. "
+                          f"Retrying in {self.reconnect_delay}s...")
+                await asyncio.sleep(self.reconnect_delay)
+                self.reconnect_delay = min(self.reconnect_delay * 2, MAX_RECONNECT_DELAY)
+
+    def _on_disconnect(self, _client):
+        if DEBUG:
+            print("Printer disconnected")
+        self.loop.call_soon_threadsafe(self.disconnected_event.set)
+
+    async def _connect(self):
+        """Connect to the printer, unless already connected"""
+        async with self.connect_lock:
+            if self.is_connected:
+                return
+
+            # Connect to the cached address first, and only scan
+            # when there is none or it didn't work
+            if self.address is None:
+                try:
+                    device = await find_printer(self.name)
+                except TRANSIENT_ERRORS as e:
+                    raise PrinterNotFoundError(f"Error looking for {self.name}: {e}") from e
+                if device is None:
+                    raise PrinterNotFoundError(f"{self.name} not found")
+                self.address = device.address
+
+            self.client = self.client_class(self.address,
+                                            disconnected_callback=self._on_disconnect)
+            try:
+                await self.client.connect()
+            except Exception as e:
+                # The printer may have a new address, scan again next time
+                self.address = None
+                self.client = None
+                raise PrinterNotFoundError(f"Error connecting to {self.name}: {e}") from e
+            if DEBUG:
+                print("Connected to", self.address)
+            self._resolve_characteristics()
+
+    def _resolve_characteristics(self):
+        """Look up the printer characteristics, by cached handle if possible"""
+        services = self.client.services
+        if self.char0_handle is not None and self.char1_handle is not None:
+            self.char0 = services.get_characteristic(self.char0_handle)
+            self.char1 = services.get_characteristic(self.char1_handle)
+            if self.char0 is not None and self.char1 is not None:
+                return
+
+        self.char0, self.char1 = find_characteristics(services)
+        if self.char0 is None or self.char1 is None:
+            raise PrinterNotFoundError("Printer characteristics not found")
+        self.char0_handle = self.char0.handle
+        self.char1_handle = self.char1.handle
+
+    async def _disconnect(self):
+        if self.client is not None and self.client.is_connected:
+            await self.client.disconnect()
+
+    async def _print(self, data):
+        await self._connect()
+
+        # Stream the data to the characteristic in MTU sized chunks
+        stats = await stream_data(self.client, self.char1, data)
+
+        # Check if the data was written
+        await self.client.read_gatt_char(self.char0)
+        return stats
+
+# --------------- Fake client to test the transfer without a printer ----------
+
+class FakeCharacteristic:
+    """Stand-in for a BleakGATTCharacteristic"""
+    def __init__(self, uuid, handle, max_write_without_response_size=None):
+        self.uuid = uuid
+        self.handle = handle
+        self.max_write_without_response_size = max_write_without_response_size
+
+class FakeService:
+    """Stand-in for a BleakGATTService"""
+    def __init__(self, characteristics):
+        self.characteristics = characteristics
+
+class FakeServiceCollection(list):
+    """Stand-in for a BleakGATTServiceCollection"""
+    def get_characteristic(self, handle):
+        for service in self:
+            for char in service.characteristics:
+                if char.handle == handle:
+                    return char
+        return None
+
+class FakeBleakClient:
+    """Stand-in for BleakClient that records what is written to the printer.
+
+    fail_at lists the indices of the writes that raise a BleakError,
+    to simulate transient link errors. Writes without response are only
+    kept once an acknowledged write follows them, as if the link dropped
+    everything in flight when it failed.
+    """
+    def __init__(self, device=None, mtu_size=185, write_delay=0.0, fail_at=(),
+                 disconnected_callback=None):
+        self.device = device
+        self.disconnected_callback = disconnected_callback
+        self.mtu_size = mtu_size
+        self.write_delay = write_delay
+        self.fail_at = set(fail_at)
+        self.is_connected = False
+        self.writes = []
+        self.in_flight = bytearray()
+        self.received = bytearray()
+        self.services = FakeServiceCollection([FakeService([
+            FakeCharacteristic(NOTIFY_CHAR_PREFIX + "-0000-1000-8000-00805f9b34fb", 1),
+            FakeCharacteristic(WRITE_CHAR_PREFIX + "-0000-1000-8000-00805f9b34fb", 3),
+        ])])
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.disconnect()
+
+    async def connect(self, **kwargs):
+        self.is_connected = True
+        return True
+
+    async def disconnect(self):
+        self.is_connected = False
+        if self.disconnected_callback:
+            self.disconnected_callback(self)
+        return True
+
+    async def write_gatt_char(self, char, data, response=None):
+        index = len(self.writes)
+        self.writes.append((bytes(data), response))
+        if index in self.fail_at:
+            self.in_flight.clear()
+            raise BleakError(f"Fake error on write {index}")
+        if self.write_delay:
+            await asyncio.sleep(self.write_delay)
+        self.in_flight += data
+        if response:
+            self.received += self.in_flight
+            self.in_flight.clear()
+
+    async def read_gatt_char(self, char):
+        return bytearray(b'\x01')
+
+async def stream_file_to_fake_printer(file_path):
+    """Stream an image to a fake printer and check what it received"""
+    with Image.open(file_path) as image:
+        data = encode_image(image)
+
+    # Fail once in the middle of the transfer to exercise the resume
+    client = FakeBleakClient(write_delay=0.001, fail_at=(CHECKPOINT_EVERY * 2 + 3,))
+    async with client:
+        _, char1 = find_characteristics(client.services)
+        await stream_data(client, char1, data)
+
+    print("Received the full job:", client.received == data)
+
+    # Print twice through a session to check that the connection is reused
+    clients = []
+    def client_class(address, **kwargs):
+        clients.append(FakeBleakClient(address, write_delay=0.001, **kwargs))
+        return clients[-1]
+
+    printer = PrinterSession(address="00:00:00:00:00:00", client_class=client_class)
+    printer.start()
+    for _ in range(2):
+        await printer.print(data)
+    printer.stop()
+    print("Session connections:", len(clients),
+          "received both jobs:", clients[0].received == data * 2)
+
+def main():
+    """Main function"""
+    if len(sys.argv) < 2:
+        print("%s filename" % (sys.argv[0]))
+        sys.exit(1)
+    asyncio.run(stream_file_to_fake_printer(sys.argv[1]))
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@
 
 # This script is used to convert an image to a format that can be printed
 # by the Phomemo M02 printer.
+# It can be run from the command line, or imported and used through
+# encode_image(), which returns the printer bytes without touching the disk,
+# or encode_raster() for images already rendered at the printer width.
 
 #! /usr/bin/python3
 
@@ -19,92 +22,167 @@ import sys
 
 from PIL import Image
 
-def print_header():
-    """Print the header of the image."""
-    with os.fdopen(sys.stdout.fileno(), "wb", closefd=False) as stdout:
-        stdout.write(b'\x1b\x40\x1b\x61\x01\x1f\x11\x02\x04')
-
-def print_marker(_lines=0x100):
-    """Print the marker of the image."""
-    with os.fdopen(sys.stdout.fileno(), "wb", closefd=False) as stdout:
-        stdout.write(0x761d.to_bytes(2, 'little'))
-        stdout.write(0x0030.to_bytes(2, 'little'))
-        stdout.write(0x0030.to_bytes(2, 'little'))
-        stdout.write((_lines - 1).to_bytes(2, 'little'))
-
-def print_footer():
-    """Print the footer of the image."""
-    with os.fdopen(sys.stdout.fileno(), "wb", closefd=False) as stdout:
-        stdout.write(b'\x1b\x64\x02')
-        stdout.write(b'\x1b\x64\x02')
-        stdout.write(b'\x1f\x11\x08')
-        stdout.write(b'\x1f\x11\x0e')
-        stdout.write(b'\x1f\x11\x07')
-        stdout.write(b'\x1f\x11\x09')
-
-def print_line(_image, _line):
-    """Print a line of the image."""
-    with os.fdopen(sys.stdout.fileno(), "wb", closefd=False) as stdout:
-        for x in range(int(_image.width / 8)):
-            byte = 0
-            for bit in range(8):
-                if _image.getpixel((x * 8 + bit, _line)) == 0:
-                    byte |= 1 << (7 - bit)
-            # 0x0a breaks the rendering
-            # 0x0a alone is processed like LineFeed by the printer
-            if byte == 0x0a:
-                byte = 0x14
-            stdout.write(byte.to_bytes(1, 'little'))
+# Printer head width in dots
+PRINTER_WIDTH = 384
+
+# Maximum number of lines per raster block
+MAX_BLOCK_LINES = 256
+
+# Minimum number of blank lines sent as a paper feed instead of raster data
+MIN_FEED_LINES = 8
+
+# Maximum number of dots fed by a single feed command
+MAX_FEED_DOTS = 255
+
+HEADER = b'\x1b\x40\x1b\x61\x01\x1f\x11\x02\x04'
+
+FOOTER = (b'\x1b\x64\x02'
+          b'\x1b\x64\x02'
+          b'\x1f\x11\x08'
+          b'\x1f\x11\x0e'
+          b'\x1f\x11\x07'
+          b'\x1f\x11\x09')
+
+# 0x0a breaks the rendering
+# 0x0a alone is processed like LineFeed by the printer
+LINE_FEED_SUBSTITUTION = bytes.maketrans(b'\x0a', b'\x14')
+
+def marker(_lines=0x100):
+    """Return the marker of a raster block."""
+    return (0x761d.to_bytes(2, 'little')
+            + 0x0030.to_bytes(2, 'little')
+            + 0x0030.to_bytes(2, 'little')
+            + (_lines - 1).to_bytes(2, 'little'))
+
+def feed(_dots):
+    """Return the command that feeds the paper by a number of dots."""
+    return b'\x1b\x4a' + _dots.to_bytes(1, 'little')
+
+def encode_lines(_image, _first_line=0, _lines=None):
+    """Encode a block of lines of a 1-bit image as packed raster bytes."""
+    if _lines is None:
+        _lines = _image.height - _first_line
+    row_bytes = int(_image.width / 8)
+    block = _image.crop((0, _first_line, _image.width, _first_line + _lines))
+    # Mode '1' packs 8 pixels per byte, MSB first, with white pixels set.
+    # The printer wants black pixels set, so invert the whole buffer at once.
+    packed = block.tobytes("raw", "1;I")
+    stride = (_image.width + 7) // 8
+    if stride != row_bytes:
+        # Drop the padding byte of rows whose width is not a multiple of 8
+        packed = b''.join(packed[row * stride:row * stride + row_bytes]
+                          for row in range(_lines))
+    return packed.translate(LINE_FEED_SUBSTITUTION)
+
+def prepare_image(image):
+    """Rotate, resize and dither an image to the printer's 384 dots width."""
+    if image.width > image.height:
+        image = image.rotate(90, expand=True)
+
+    # width 384 dots
+    if image.width != PRINTER_WIDTH:
+        image = image.resize(
+            size=(PRINTER_WIDTH, int(image.height * PRINTER_WIDTH / image.width)))
+
+    # black&white printer: dithering
+    if image.mode != '1':
+        image = image.convert(mode='1')
+
+    return image
+
+def split_blank_rows(packed, row_bytes):
+    """Split packed raster rows into runs of blank and printed rows.
+
+    Return a list of (blank, first_line, lines) tuples. Blank runs shorter
+    than MIN_FEED_LINES are kept with the printed rows around them.
+    """
+    blank_row = bytes(row_bytes)
+    height = len(packed) // row_bytes if row_bytes else 0
+    runs = []
+    line = 0
+    while line < height:
+        first_line = line
+        blank = packed[line * row_bytes:(line + 1) * row_bytes] == blank_row
+        while (line < height
+               and (packed[line * row_bytes:(line + 1) * row_bytes] == blank_row) == blank):
+            line += 1
+        if blank and line - first_line < MIN_FEED_LINES:
+            blank = False
+        if runs and not blank and not runs[-1][0]:
+            # Merge with the previous printed run
+            runs[-1] = (False, runs[-1][1], line - runs[-1][1])
+        else:
+            runs.append((blank, first_line, line - first_line))
+    return runs
+
+def encode_raster(image, feed_blank_rows=False):
+    """Convert a 1-bit image already at the printer width to a M02 print job.
+
+    With feed_blank_rows, runs of blank rows are sent as paper feed
+    commands instead of raster data.
+    """
+    packed = encode_lines(image)
+    row_bytes = int(image.width / 8)
+    if feed_blank_rows:
+        runs = split_blank_rows(packed, row_bytes)
+    else:
+        runs = [(False, 0, image.height)]
+
+    data = bytearray(HEADER)
+    for blank, line, remaining in runs:
+        if blank:
+            while remaining > 0:
+                dots = min(remaining, MAX_FEED_DOTS)
+                data += feed(dots)
+                remaining -= dots
+            continue
+        while remaining > 0:
+            lines = min(remaining, MAX_BLOCK_LINES)
+            data += marker(lines)
+            data += packed[line * row_bytes:(line + lines) * row_bytes]
+            remaining -= lines
+            line += lines
+    data += FOOTER
+    return bytes(data)
+
+def encode_image(image):
+    """Convert an image to the bytes of a M02 print job."""
+    return encode_raster(prepare_image(image))
 
 def usage():
     """Print the usage of the script."""
     print("%s [-h|--help] filename" % (sys.argv[0]))
 
-try:
-    opts, args = getopt.getopt(sys.argv[1:], "h", ["help"])
-except getopt.error as err:
-    print (str(err))
-    usage()
-    sys.exit(1)
+def main():
+    """Main function"""
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "h", ["help"])
+    except getopt.error as err:
+        print (str(err))
+        usage()
+        sys.exit(1)
 
-for opt, arg in opts:
-    if opt in ("-h", "--help"):
+    for opt, _ in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit()
+
+    try:
+        name = sys.argv[1]
+    except IndexError:
+        print("Missing filename")
+        usage()
+        sys.exit(1)
+
+    try:
+        image = Image.open(name)
+    except IOError as e:
+        print("Error opening file:",(e))
         usage()
-        sys.exit()
-
-try:
-    name = sys.argv[1]
-except IndexError:
-    print("Missing filename")
-    usage()
-    sys.exit(1)
-
-try:
-    image = Image.open(name)
-except IOError as e:
-    print("Error opening file:",(e))
-    usage()
-    sys.exit(2)
-
-if image.width > image.height:
-    image = image.rotate(90, expand=True)
-
-# width 384 dots
-image = image.resize(size=(384, int(image.height * 384 / image.width)))
-
-# black&white printer: dithering
-image = image.convert(mode='1')
-
-remaining = image.height
-line = 0
-print_header()
-while remaining > 0:
-    lines = remaining
-    lines = min(lines, 256)
-    print_marker(lines)
-    remaining -= lines
-    while lines > 0:
-        print_line(image, line)
-        lines -= 1
-        line += 1
-print_footer()
+        sys.exit(2)
+
+    with os.fdopen(sys.stdout.fileno(), "wb", closefd=False) as stdout:
+        stdout.write(encode_image(image))
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,42 @@
 """
 Modules:
-- TTS: Text-to-Speech
-- bleak: Bluetooth Low Energy
-- requests: HTTP requests
+- tts_worker: Text-to-Speech worker process
+- bleak: Bluetooth Low Energy, imported by the printing phase
+- llm_client: LLAMA3 API client
+- startup: Staged startup and readiness of the features
 - threading: Multithreading
 - asyncio: Asynchronous I/O
 - queue: Thread-safe queue
 - serial: Serial communication
-- pygame: Audio playback
-- PIL: Image manipulation
+- pygame: Audio playback, imported by the audio phase
+- sound_cache: Decoded sounds, created by the audio phase
 """
 
-import json
+import time
+IMPORTS_STARTED = time.perf_counter()
+
 import os
 import sys
-import time
 import random
 from enum import Enum
 import threading
-import concurrent.futures
 import asyncio
 import queue
-from regex import D
-import requests
 import serial
-import pygame
-from playsound import playsound
-from TTS.api import TTS
-from bleak import BleakScanner, BleakClient
-from PIL import Image, ImageFont, ImageDraw, ImageColor
+import move_bird as bird
 from move_bird import move_bird
+from llm_client import LlamaClient, LlamaError, OllamaBackend, check_poem_lines
+from poem_reservoir import PoemReservoir
+from clip_library import ClipLibrary
+from audio_catalog import AudioCatalog
+from startup import StartupRegistry
+from tts_worker import TTSWorker, part_path
+
+# Readiness of the features started in main(), and the startup timing report
+startup = StartupRegistry(IMPORTS_STARTED)
+
+# Imported by the audio phase in main()
+pygame = None
 
 # Set the device to use for TTS
 TTS_DEVICE = "cpu"
@@ -109,39 +116,98 @@ audio_playback_lock = threading.Lock()
 current_audio_playback = None
 tts_generation_thread = None
 
-# Init TTS
-TTS = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to(TTS_DEVICE)
+# XTTS runs in its own process, started in main()
+tts_worker = TTSWorker(device=TTS_DEVICE)
+
+# Speech generated while idle, loaded in main()
+clip_library = None
+
+# Folders of the clips played while idle
+IDLE_AUDIO_FOLDERS = {
+    "realejo": "audio/realejo",
+    "pre-recorded": "tts/idle/pre-recorded",
+}
+
+# Lists of the clips of IDLE_AUDIO_FOLDERS, started in main()
+audio_catalog = None
+
+# Decoded sounds of the clips played over and over, bounded by
+# SOUND_CACHE_BYTES, created by the audio phase in main()
+sound_cache = None
+SOUND_CACHE_BYTES = 64 * 1024 * 1024
+CACHED_AUDIO_FOLDERS = ("audio/", "tts/interaction/", "tts/idle/pre-recorded/")
 
-PRINTER_DATA_FORMATTER = "m02_printer_data_formatter.py"
+# Sounds of the interactions, decoded at startup
+STINGERS = [
+    "tts/interaction/before.wav",
+    "audio/interaction/interlude.wav",
+    "tts/interaction/after.wav",
+]
+
+# Seconds the idle speech waits for the TTS model to be loaded
+TTS_READY_TIMEOUT = 300
+
+# Play the idle poems line by line while they are synthesized
+STREAM_IDLE_SPEECH = True
+SPEECH_PARTS_FOLDER = "tts/idle/stream"
+SPEECH_PARTS_PREFIX = f"{SPEECH_PARTS_FOLDER}/part_"
+
+# Set while the lines of a poem are played as they are synthesized,
+# so the idle flow doesn't queue other audio between them
+speech_streaming = threading.Event()
 
 SKIP_PRINTING = False
 
+# Keep a PNG copy of every printed poem in generated-poems/img
+ARCHIVE_POEM_IMAGES = True
+
+# Send blank rows of the poem image as paper feeds instead of raster data
+FEED_BLANK_ROWS = True
+
+# Connection to the printer, kept open between interactions,
+# created by the printing phase in main()
+printer = None
+
+# Background thread printing the poems, started in main()
+print_spooler = None
+
 # ------------- Poem generation and LLAMA3 API-related functions ---------------
 
+# Set to "fake" to generate the poems with the bundled fake LLAMA3 API,
+# to run the realejo without Ollama
+LLM_BACKEND = "ollama"
+
+def create_llm_backend():
+    """Create the backend of the LLAMA3 API set in LLM_BACKEND"""
+    if LLM_BACKEND == "fake":
+        from fake_llm_server import FakeLlamaBackend
+        return FakeLlamaBackend()
+    return OllamaBackend()
+
+# Client of the LLAMA3 API, keeping its connections and the model warm
+llama = LlamaClient(create_llm_backend())
+
+# Poems generated ahead of time while idle, started in main()
+poem_reservoir = None
+
+# Seconds to wait for a poem before printing a cached one
+GENERATION_TIMEOUT = 60
+
+# Seconds an interaction waits for the printing phase to be done
+PRINTING_READY_TIMEOUT = 30
+
 def get_topic(type):
     """Select a random prompt from the pre-defined list"""
     if type == "fortune teller":
         return random.choice(FORTUNE_TELLER_PROMPTS)
     return random.choice(POEM_TOPICS)
 
-def get_llama3_response(prompt):
+def get_llama3_response(prompt, profile="poem"):
     """Make a POST request to LLAMA3 API"""
-    api_endpoint = "http://localhost:11434/api/generate"
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "model": "llama3",
-        "prompt": prompt,
-        "options": {"num_ctx": 4096}
-    }
-
     try:
         if DEBUG:
             print("Sending request to LLAMA3 API...")
-        response = requests.post(api_endpoint,
-                                 headers=headers,
-                                 json=payload,
-                                 stream=True,
-                                 timeout=100)
+        response = llama.generate(prompt, profile)
 
         if DEBUG:
             print("Response from LLAMA3 API:", response.status_code)
@@ -150,243 +216,159 @@ def get_llama3_response(prompt):
         print(f"Error in get_llama3_response: {e}")
         return None
 
+def stream_poem(response):
+    """Return a stream of the tokens and lines of a LLAMA3 API response"""
+    return llama.stream(response)
+
 def parse_streamed_response(response):
     """Parse the streamed response from LLAMA3 API"""
-    full_response = ""
-    for line in response.iter_lines():
-        if line:
-            decoded_line = line.decode('utf-8')
-            json_obj = json.loads(decoded_line)
-            if "response" in json_obj:
-                full_response += json_obj["response"]
-    return full_response
+    return stream_poem(response).read()
+
+def generate_poem(topic, profile="poem"):
+    """Generate a 5 line poem about a topic, returning None if it failed"""
+    prompt = PROMPT_PREFIX + topic + PROMPT_SUFFIX
+    if DEBUG:
+        print("Prompt to LLAMA3:", prompt)
+
+    response = get_llama3_response(prompt, profile)
+    if not response or response.status_code != 200:
+        print("Failed to get a response from LLAMA3 or invalid response.",
+              "Status code:", response.status_code if response else "N/A")
+        return None
+    try:
+        poem = parse_streamed_response(response)
+    except Exception as e:
+        print(f"Error in parse_streamed_response: {e}")
+        return None
+    return check_poem_lines(poem)
+
+async def generate_poem_async(topic, profile="poem"):
+    """Generate a 5 line poem about a topic on asyncio streams, returning None if it failed"""
+    prompt = PROMPT_PREFIX + topic + PROMPT_SUFFIX
+    if DEBUG:
+        print("Prompt to LLAMA3:", prompt)
+
+    try:
+        poem = await llama.generate_text_async(prompt, profile)
+    except (OSError, LlamaError, ValueError) as e:
+        print(f"Failed to get a response from LLAMA3: {e}")
+        return None
+    return check_poem_lines(poem)
 
 def generate_tts_poem_in_idle():
     global tts_generation_thread
     topic = get_topic("fortune teller")
-    prompt = PROMPT_PREFIX + topic + PROMPT_SUFFIX
-    response = get_llama3_response(prompt)
-    poem = parse_streamed_response(response)
-    generate_tts(poem)
+    poem = generate_poem(topic, "fortune teller")
+    if poem:
+        generate_tts(poem, topic)
     
 # ----------------------- TTS generation functions -----------------------------
 
-def generate_tts(text):
-    """Generate audio from poem using TTS"""
+def generate_tts(text, topic=None):
+    """Generate audio from poem using TTS, adding it to the clip library"""
+    if not startup.wait_ready("tts", TTS_READY_TIMEOUT):
+        print("The TTS model isn't loaded, skipping the speech")
+        return
     if DEBUG:
         print("Generating speech from text...")
-    number_idle_recordings = len(
-    [f for f in os.listdir("tts/idle/generated") if f.endswith(".wav")])
-    file_path = f"tts/idle/generated/output_{number_idle_recordings + 1}.wav"
+    clip_id, file_path = clip_library.allocate()
+
+    on_part = None
+    if STREAM_IDLE_SPEECH:
+        # The lines of the previous poem were played long ago
+        os.makedirs(SPEECH_PARTS_FOLDER, exist_ok=True)
+        for f in os.listdir(SPEECH_PARTS_FOLDER):
+            os.remove(f"{SPEECH_PARTS_FOLDER}/{f}")
+
+        def on_part(part):
+            if state == State.IDLE:
+                audio_queue.put(part.file_path)
+
+        speech_streaming.set()
+
     try:
-        TTS.tts_to_file(text, speaker_wav="tts/voice-cloning/ref.wav", language="en", file_path=file_path) # type: ignore
+        # Wait on the worker process, which synthesizes off the GIL of this one
+        result = tts_worker.synthesize(text, file_path, on_part=on_part,
+                                       parts_prefix=SPEECH_PARTS_PREFIX).result()
+        clip_library.add(clip_id, topic, result.audio_duration)
         if DEBUG:
             print(f"Audio saved as {file_path}")
+            if result.time_to_first_audio is not None:
+                print(f"Time to first audio {result.time_to_first_audio:.1f}s")
     except Exception as e:
+        clip_library.discard(clip_id)
         print(f"Error generating speech: {e}")
-        
+    finally:
+        speech_streaming.clear()
+
 def generate_tts_thread():
     """Generate audio from text using TTS in a separate thread"""
+    global tts_generation_thread
+    # One poem at a time, the worker would only queue the next one
+    if tts_generation_thread is not None and tts_generation_thread.is_alive():
+        return
     if DEBUG:
         print("Starting TTS generation thread...")
-    global tts_generation_thread
     tts_generation_thread = threading.Thread(target=generate_tts_poem_in_idle)
     tts_generation_thread.start()
 
 # ----------------------- Printing-related functions ---------------------------
 
-def generate_image_from_text(
-    text: str,
-    font_path: str):
-    """Generate an image from text"""
-
-    # Set the image size
-    image_size = (256, 400)
-    padding = 10
-
-    font_size = 20
-
-    # Set the font
-    font = ImageFont.truetype(font_path, font_size)
-
-    # Create the image
-    image = Image.new("RGB", image_size, "white")
-    draw = ImageDraw.Draw(image)
-
-    # Wrap the text
-    wrapped_text = wrap_text(text, font, image_size[0] - 2 * padding)
-
-    # Calculate text position
-    text_position = (padding, padding)
-
-    # Draw the text on the image
-    draw.multiline_text(text_position, wrapped_text, font=font, fill=ImageColor.getrgb("black"))
-    
-    generated_poems_count = len(
-        [f for f in os.listdir("generated-poems/txt") if f.endswith(".txt")])
-
-    # Save the image
-    image.save(f"generated-poems/img/poem-{generated_poems_count}.png")
-
-    if DEBUG:
-        print(f"Text image saved")
-
-# Method to find the bluetooth printer device
-async def find_printer():
-    """Find the printer device"""
-    if DEBUG:
-        print("Scanning for Bluetooth devices...")
-    devices = await BleakScanner.discover()
-
-    target_device = None
-    for device in devices:
-        if device.name == "Mr.in_M02":
-            target_device = device
-            break
-
-    if not target_device:
-        return None
-
-    if DEBUG:
-        print("Found the printer:", target_device)
-    return target_device
-
-# Function to handle printing process
-async def print_file(device, data_formatter_script_loc, file_path):
-    """Try to print the file"""
+def save_poem_image(image, file_path):
+    """Save a poem image to disk"""
     try:
-        async with BleakClient(device) as client:
-            if DEBUG:
-                print("Connected to", device)
-
-            # Discover services
-            services = client.services
-
-            #if DEBUG:
-                #print("Services:", services)
-
-            char0 = None
-            char1 = None
-
-            for service in services:
-                for char in service.characteristics:
-                    # if DEBUG:
-                    #     print(f"Characteristic {char.uuid}: {char}")
-                    # char0 should start with 0000ff01
-                    if char.uuid.startswith("0000ff01"):
-                        char0 = char.uuid
-                    # char1 should start with 0000ff02
-                    if char.uuid.startswith("0000ff02"):
-                        char1 = char.uuid
-
-            # if DEBUG:
-            #     print("Characteristics:", char0, char1)
-
-            # Write the data
-            path_pho = file_path + ".pho"
-
-            command = f"python3 {data_formatter_script_loc} {file_path} > {path_pho}"
-            os.system(command)
-            if DEBUG:
-              print("Data written to printer")
-
-            # Write data to characteristic
-
-            with open(path_pho, "rb") as f:
-                data = f.read()
-
-                # if DEBUG:
-                #     print("Data bytes:", len(data))
-                #     print("Data:", data)
-
-                # Write the data
-                await client.write_gatt_char(char1, data, response=True) # type: ignore
-
-                # Check if the data was written
-                await client.read_gatt_char(char0) # type: ignore
-
-            # Remove the file
-            os.remove(path_pho)
-
+        image.save(file_path)
+        if DEBUG:
+            print(f"Text image saved as {file_path}")
     except Exception as e:
-        print(f"Failed to connect or print: {e}")
-
-# Function to wrap text to fit within the specified width,
-# while still keeping original line breaks
-def wrap_text(text, font, max_width):
-    """Wrap text to fit within the specified width, while still keeping original line breaks"""
-    lines = text.split("\n")
-    wrapped_lines = []
-    for line in lines:
-        words = line.split()
-        wrapped_line = ""
-        for word in words:
-            wrapped_line_test = wrapped_line + word + " "
-            wrapped_line_test_bbox = font.getbbox(wrapped_line_test)
-            if wrapped_line_test_bbox[2] <= max_width:
-                wrapped_line = wrapped_line_test
-            else:
-                wrapped_lines.append(wrapped_line)
-                wrapped_line = word + " "
-        wrapped_lines.append(wrapped_line)
-    return "\n".join(wrapped_lines)
+        print(f"Error saving poem image: {e}")
+
+def archive_poem_image(image, file_path):
+    """Save a poem image in a separate thread, off the printing path"""
+    if not ARCHIVE_POEM_IMAGES:
+        return
+    archive_thread = threading.Thread(target=save_poem_image, args=(image, file_path))
+    archive_thread.daemon = True
+    archive_thread.start()
+
+def render_print_job(job):
+    """Render the poem of a print job as printer data"""
+    # Render the poem at the printer width and format it
+    # as printer data, without going through the disk
+    from m02_printer_data_formatter import encode_raster
+    from poem_renderer import generate_image_from_text
+    if DEBUG:
+        print("Generating an image from the poem...")
+    image = generate_image_from_text(job.text, FONT)
+    if job.name:
+        archive_poem_image(image, f"generated-poems/img/{job.name}.png")
+    return encode_raster(image, feed_blank_rows=FEED_BLANK_ROWS)
 
 # --------------- Audio thread and playback control functions -----------------
 
-class AudioPlayer(threading.Thread):
-    def __init__(self, stop_event, audio_queue, playback_lock):
-        super().__init__()
-        self.stop_event = stop_event
-        self.audio_queue = audio_queue
-        self.playback_lock = playback_lock
-        self.current_audio_file = None
-        pygame.mixer.init()
-
-    def run(self):
-        while not self.stop_event.is_set():
-            try:
-                # Try to get an audio file from the queue
-                audio_file = self.audio_queue.get(timeout=1)
-                if audio_file is None:
-                    break
-
-                # If audio src is /idle/generated or /idle/pre-recorded,
-                # move the bird while playing the audio
-                if "idle/generated" in audio_file or "idle/pre-recorded" in audio_file:
-                    move_bird()
-                self.play_audio(audio_file)
-                self.audio_queue.task_done()
-            except queue.Empty:
-                # If the queue is empty, sleep briefly to avoid high CPU usage
-                time.sleep(1)
-
-        print("Audio playback thread exiting...")
-
-    def play_audio(self, audio_file):
-        """Play an audio file and handle stopping the current playback if needed."""
-        try:
-            with self.playback_lock:
-                # Stop the current playback if it exists
-                pygame.mixer.music.stop()
-
-                # Load and play the new audio file
-                pygame.mixer.music.load(audio_file)
-                pygame.mixer.music.play()
-                self.current_audio_file = audio_file
-                
-                # Wait for the playback to finish
-                while pygame.mixer.music.get_busy():
-                    if self.stop_event.is_set():
-                        pygame.mixer.music.stop()
-                        break
-                    pygame.time.Clock().tick(10)
-        except Exception as e:
-            print(f"Error playing audio file {audio_file}: {e}")
+def play_sound(audio_file):
+    """Play an audio file from the sound cache, returning when it ends"""
+    sound = sound_cache.get(audio_file)
+    sound.play()
+    time.sleep(sound.get_length())
+
+def move_bird_for_speech(audio_file):
+    """Move the bird before the speech clips"""
+    # If audio src is /idle/generated or /idle/pre-recorded,
+    # move the bird while playing the audio. A streamed poem only
+    # moves it before its first line, so the lines follow each other
+    if ("idle/generated" in audio_file or "idle/pre-recorded" in audio_file
+            or audio_file == part_path(SPEECH_PARTS_PREFIX, 0)):
+        move_bird()
 
 def start_audio_playback_thread():
     global audio_playback_thread, stop_audio_event, audio_queue, audio_playback_lock
+    # Imported by the audio phase, with pygame
+    from audio_player import AudioPlayer
     stop_audio_event.clear()
-    audio_playback_thread = AudioPlayer(stop_audio_event, audio_queue, audio_playback_lock)
+    audio_playback_thread = AudioPlayer(stop_audio_event, audio_queue, audio_playback_lock,
+                                        before_play=move_bird_for_speech,
+                                        sound_cache=sound_cache)
     audio_playback_thread.start()
 
 def stop_audio_playback_thread():
@@ -464,26 +446,26 @@ def run_idle_flow():
                 if random.random() < 1/200:
                     # Make the HTTP request asynchronously, and wait for the response
                     generate_tts_thread()
-                    
-                    
+
+                # Leave the audio queue to the lines of the poem being streamed
+                if speech_streaming.is_set():
+                    time.sleep(1)
+                    continue
                 
-                # Create a list of .wav files from the audio folder
-                audio_files = [f for f in os.listdir("audio/realejo") if f.endswith(".wav")]
-                if audio_files:
-                    audio_file = "audio/realejo/" + random.choice(audio_files)
+                # Pick the clips from memory, the catalog watches the folders
+                audio_file = audio_catalog.pick("realejo")
+                if audio_file:
                     audio_queue.put(audio_file)
                     time.sleep(1) 
                     
-                audio_src_folder = "tts/idle/pre-recorded/"
-                generated_count = len(
-                    [f for f in os.listdir("tts/idle/generated") if f.endswith(".wav")])
-                if random.random() < 0.5 and generated_count > 0:
-                    audio_src_folder = "tts/idle/generated/"
-
-                # Change the list of audio files to the pre-recorded TTS files
-                audio_files = [f for f in os.listdir(audio_src_folder) if f.endswith(".wav")]
-                if audio_files:
-                    audio_file = audio_src_folder + random.choice(audio_files)
+                # Half of the time, play a generated poem from the library
+                audio_file = clip_library.pick() if random.random() < 0.5 else None
+
+                # Otherwise, or if none was generated yet, a pre-recorded one
+                if audio_file is None:
+                    audio_file = audio_catalog.pick("pre-recorded")
+
+                if audio_file:
                     audio_queue.put(audio_file)
                     time.sleep(3)  # Adjust the interval as needed
 
@@ -520,95 +502,171 @@ async def run_interaction_flow():
     if DEBUG:
         print("Running the interaction flow...")
         
-    # Generate a poem
-    topic = get_topic("poem")
-    prompt = PROMPT_PREFIX + topic + PROMPT_SUFFIX
-    if DEBUG:
-        print("Prompt to LLAMA3:", prompt)
-    
-    # Make the HTTP request asynchronously, and wait for the response
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future = executor.submit(get_llama3_response, prompt)
-
-        # Play the audio and move the bird at the same time
-        await asyncio.gather(
-            asyncio.to_thread(playsound, "tts/interaction/before.wav"),
-            asyncio.to_thread(move_bird)
-        )
-        
-        interlude_player = pygame.mixer.Sound("audio/interaction/interlude.wav")
+    # Take a poem generated ahead of time, and only ask LLAMA3
+    # for a new one if there is none ready
+    poem = poem_reservoir.take() if poem_reservoir is not None else None
+
+    generation = None
+    if poem is None:
+        # Generate the poem while the bird talks, giving up at the deadline
+        generation = asyncio.create_task(asyncio.wait_for(
+            generate_poem_async(get_topic("poem")), GENERATION_TIMEOUT))
+
+    # Play the audio and move the bird at the same time
+    await asyncio.gather(
+        asyncio.to_thread(play_sound, "tts/interaction/before.wav"),
+        asyncio.to_thread(move_bird)
+    )
+
+    interlude_player = None
+    if generation is not None:
+        # Play the interlude while waiting for the poem
+        interlude_player = sound_cache.get("audio/interaction/interlude.wav")
         interlude_player.play()
+        try:
+            poem = await generation
+        except asyncio.TimeoutError:
+            print("Poem generation timed out")
+        except Exception as e:
+            print(f"Poem generation failed: {e}")
+        if not poem:
+            # Only a poem the reservoir finished in the meantime: the poems
+            # printed before are never handed out again
+            poem = poem_reservoir.take() if poem_reservoir is not None else None
+            if poem and DEBUG:
+                print("Using a poem from the reservoir")
+
+    if poem:
+        if DEBUG:
+            print("Poem generated:", poem)
         
-        response = future.result()
-
-        if response and response.status_code == 200:
-            poem = parse_streamed_response(response)
-            
+        if not SKIP_PRINTING:
+            # Generate a .txt file with the poem
             if DEBUG:
-                print("Poem generated:", poem)
-            
-            if not SKIP_PRINTING:
-                if DEBUG:
-                    print("Generating speech from response...")
-    
-                # Generate a .txt file with the poem
-                if DEBUG:
-                    print("Saving the poem as a .txt file...")
-                # Track generated poem files
-                generated_poems_count = len(
-                    [f for f in os.listdir("generated-poems/txt") if f.endswith(".txt")]) + 1
-                with open(f"generated-poems/txt/poem-{generated_poems_count}.txt",
-                        "w", encoding="utf-8") as file:
-                    file.write(poem)
-
-                # Generate a 256x256 image with the text of the poem
-                if DEBUG:
-                    print("Generating an image from the poem...")
-                generate_image_from_text(poem, FONT)
-
-                # Print the poem
-                if DEBUG:
-                    print("Printing the poem...")
-                printer = await find_printer()
-
-                # The printer is sometimes not found, so we need to loop
-                # until it is found
-                while not printer:
-                    print("Error: printer not found. Trying again...")
-                    printer = await find_printer()
-
-                if printer:
-                    await print_file(
-                    printer, PRINTER_DATA_FORMATTER,
-                    f"generated-poems/img/poem-{generated_poems_count}.png")
-                    
-            # Stop the interlude audio
+                print("Saving the poem as a .txt file...")
+            # Track generated poem files
+            generated_poems_count = len(
+                [f for f in os.listdir("generated-poems/txt") if f.endswith(".txt")]) + 1
+            with open(f"generated-poems/txt/poem-{generated_poems_count}.txt",
+                    "w", encoding="utf-8") as file:
+                file.write(poem)
+
+            # Queue the poem to be rendered and printed in the
+            # background, so the interaction can carry on
+            if DEBUG:
+                print("Printing the poem...")
+            if await asyncio.to_thread(startup.wait_ready, "printing", PRINTING_READY_TIMEOUT):
+                print_spooler.enqueue(text=poem, name=f"poem-{generated_poems_count}")
+            else:
+                print("Printing isn't ready, the poem is only saved")
+                
+        # Stop the interlude audio
+        if interlude_player:
             interlude_player.stop()
-                    
-            # Play the audio and move the bird at the same time
-            await asyncio.gather(
-                asyncio.to_thread(
-                    playsound, "tts/interaction/after.wav"),
-                    asyncio.to_thread(move_bird))
-
-        else:
-            print("Failed to get a response from LLAMA3 or invalid response.",
-                "Status code:", response.status_code if response else "N/A")
+                
+        # Play the audio and move the bird at the same time
+        await asyncio.gather(
+            asyncio.to_thread(
+                play_sound, "tts/interaction/after.wav"),
+                asyncio.to_thread(move_bird))
+
+    else:
+        # No poem to print, the bird still closes the reading
+        print("No poem for this interaction, nothing is printed")
+        if interlude_player:
+            interlude_player.stop()
+        await asyncio.gather(
+            asyncio.to_thread(
+                play_sound, "tts/interaction/after.wav"),
+                asyncio.to_thread(move_bird))
 
     if DEBUG:
         print("End of interaction flow.")
 
+# ---------------------------- Startup phases ----------------------------------
+
+def load_audio():
+    """Import pygame, initialize the mixer and create the sound cache"""
+    global pygame, sound_cache
+    pygame = startup.timed_import("pygame")
+    pygame.mixer.init()
+    startup.timed_import("audio_player")
+    sound_cache_module = startup.timed_import("sound_cache")
+    sound_cache = sound_cache_module.SoundCache(SOUND_CACHE_BYTES, CACHED_AUDIO_FOLDERS)
+
+def prewarm_stingers():
+    """Decode the sounds of the interactions ahead of the first one"""
+    sound_cache.prewarm(STINGERS)
+
+def start_llm():
+    """Start LLAMA3 and the poem reservoir"""
+    global poem_reservoir
+    # Load the model in the background and keep it loaded while idle,
+    # so the first poem doesn't pay for a cold start
+    llama.backend.start()
+    llama.start_keep_warm()
+
+    # Generate poems while idle, so the interactions don't wait for LLAMA3
+    poem_reservoir = PoemReservoir(generate_poem, POEM_TOPICS)
+    poem_reservoir.start()
+
+def start_tts():
+    """Load XTTS in its own process"""
+    tts_worker.start()
+    # The worker sets the readiness once the model is loaded
+    startup.add("tts", tts_worker.ready_event)
+
+def load_printing():
+    """Import the printing modules, load the fonts and connect to the printer"""
+    global printer, print_spooler
+    startup.timed_import("PIL.Image")
+    startup.timed_import("bleak")
+    poem_renderer = startup.timed_import("poem_renderer")
+    m02_printer = startup.timed_import("m02_printer")
+    print_spooler_module = startup.timed_import("print_spooler")
+
+    # Load the poem font once, so rendering doesn't have to
+    poem_renderer.warm_up_fonts([FONT])
+
+    # Connect to the printer in the background, so the first
+    # interaction doesn't have to scan and connect
+    printer = m02_printer.PrinterSession()
+    printer.start()
+    print_spooler = print_spooler_module.PrintSpooler(printer, render_print_job)
+    print_spooler.start()
+
 # ---------------------------- Main Function -----------------------------------
 
 def main():
     """Main function"""
-    global button_thread, audio_playback_thread, state, stop_idle_event, stop_button_event, arduino, idle_thread, audio_queue, state_lock
+    global button_thread, audio_playback_thread, state, stop_idle_event, stop_button_event, arduino, idle_thread, audio_queue, state_lock, print_spooler, poem_reservoir, clip_library, audio_catalog
     
+    if DEBUG:
+        print(f"Imports of main.py took {time.perf_counter() - IMPORTS_STARTED:.2f}s")
+
+    # The button and the audio come up first, so the realejo can react
     try:
         arduino = serial.Serial(ARDUINO_PORT, 9600)
     except Exception as e:
         print(f"Failed to connect to Arduino: {e}")
         sys.exit(1)
+    startup.mark_ready("serial")
+    startup.run_phase("audio", load_audio)
+    startup.run_phase("stingers", prewarm_stingers, background=True)
+
+    # Index of the generated speech and lists of the idle clips,
+    # read before the idle flow picks from them
+    clip_library = ClipLibrary()
+    audio_catalog = AudioCatalog(IDLE_AUDIO_FOLDERS)
+    audio_catalog.start()
+
+    # The slow parts start in the background
+    startup.run_phase("servo", bird.open_port, background=True)
+    startup.run_phase("llm", start_llm, background=True)
+    startup.run_phase("tts worker", start_tts, background=True)
+    if not SKIP_PRINTING:
+        startup.run_phase("printing", load_printing, background=True)
+    startup.report_when_started()
 
     while True:
         try:
@@ -626,6 +684,10 @@ def main():
                     start_idle_flow()
 
             elif state == State.INTERACTION:
+                # Leave LLAMA3 to the interaction
+                if poem_reservoir is not None:
+                    poem_reservoir.pause()
+
                 if button_thread is not None and button_thread.is_alive():
                     stop_button_monitoring()
 
@@ -635,12 +697,22 @@ def main():
                 if audio_playback_thread is not None and audio_playback_thread.is_alive():
                     stop_audio_playback_thread()
 
-                asyncio.run(run_interaction_flow())
+                # Back to idle even if the interaction failed, so it
+                # isn't run again without a button press
+                try:
+                    asyncio.run(run_interaction_flow())
+                finally:
+                    if poem_reservoir is not None:
+                        poem_reservoir.resume()
+
+                    if DEBUG:
+                        sound_cache.report()
+                        print("Resuming idle state...")
+                    with state_lock:
+                        state = State.IDLE
 
-                if DEBUG:
-                    print("Resuming idle state...")
-                with state_lock:
-                    state = State.IDLE
+            # Save the play counts here, so the idle flow doesn't write to disk
+            clip_library.flush()
 
             time.sleep(5)
             
@@ -662,6 +734,28 @@ def main():
                 
             if audio_queue:
                 audio_queue.put(None)
+
+            if print_spooler:
+                print_spooler.stop()
+
+            if printer:
+                printer.stop()
+
+            bird.close_port()
+
+            audio_catalog.stop()
+            clip_library.flush()
+
+            if sound_cache is not None:
+                sound_cache.report()
+
+            llama.stop_keep_warm()
+            llama.backend.stop()
+
+            if poem_reservoir is not None:
+                poem_reservoir.stop()
+
+            tts_worker.stop()
         
             break 
         
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import os
+import threading
 from scservo_sdk import *  # Uses SCServo SDK library
 
 # Control table address
@@ -32,29 +33,44 @@ portHandler = PortHandler(DEVICENAME)
 # Initialize PacketHandler instance
 packetHandler = PacketHandler(protocol_end)
 
-# Open port
-if not portHandler.openPort():
-    print("Failed to open the port")
-    quit()
-
-# Set port baudrate
-if not portHandler.setBaudRate(BAUDRATE):
-    print("Failed to change the baudrate")
-    quit()
-
-# Write SCServo acc
-scs_comm_result, scs_error = packetHandler.write1ByteTxRx(portHandler, SCS_ID, ADDR_SCS_GOAL_ACC, SCS_MOVING_ACC)
-if scs_comm_result != COMM_SUCCESS:
-    print("%s" % packetHandler.getTxRxResult(scs_comm_result))
-elif scs_error != 0:
-    print("%s" % packetHandler.getRxPacketError(scs_error))
-
-# Write SCServo speed
-scs_comm_result, scs_error = packetHandler.write2ByteTxRx(portHandler, SCS_ID, ADDR_SCS_GOAL_SPEED, SCS_MOVING_SPEED)
-if scs_comm_result != COMM_SUCCESS:
-    print("%s" % packetHandler.getTxRxResult(scs_comm_result))
-elif scs_error != 0:
-    print("%s" % packetHandler.getRxPacketError(scs_error))
+# The port is opened on the first move, not at import time
+port_open = False
+port_lock = threading.Lock()
+
+def open_port():
+    """Open the servo port and set the servo up, returning whether it is open"""
+    global port_open
+    with port_lock:
+        if port_open:
+            return True
+
+        # Open port
+        if not portHandler.openPort():
+            print("Failed to open the port")
+            return False
+
+        # Set port baudrate
+        if not portHandler.setBaudRate(BAUDRATE):
+            print("Failed to change the baudrate")
+            portHandler.closePort()
+            return False
+
+        # Write SCServo acc
+        scs_comm_result, scs_error = packetHandler.write1ByteTxRx(portHandler, SCS_ID, ADDR_SCS_GOAL_ACC, SCS_MOVING_ACC)
+        if scs_comm_result != COMM_SUCCESS:
+            print("%s" % packetHandler.getTxRxResult(scs_comm_result))
+        elif scs_error != 0:
+            print("%s" % packetHandler.getRxPacketError(scs_error))
+
+        # Write SCServo speed
+        scs_comm_result, scs_error = packetHandler.write2ByteTxRx(portHandler, SCS_ID, ADDR_SCS_GOAL_SPEED, SCS_MOVING_SPEED)
+        if scs_comm_result != COMM_SUCCESS:
+            print("%s" % packetHandler.getTxRxResult(scs_comm_result))
+        elif scs_error != 0:
+            print("%s" % packetHandler.getRxPacketError(scs_error))
+
+        port_open = True
+        return True
 
 def move_servo(goal_position):
     """Move the servo motor to a specified angle"""
@@ -93,6 +109,8 @@ def move_servo(goal_position):
         print("%s" % packetHandler.getRxPacketError(scs_error))
         
 def move_bird():
+    if not open_port():
+        return
     move_servo(NEUTRAL_POSITION)
     move_servo(TARGET_POSITION_MIN)
     move_servo(TARGET_POSITION_MAX)
@@ -104,4 +122,8 @@ def move_bird():
 
 # Close port when done
 def close_port():
-    portHandler.closePort()
\ No newline at end of file
+    global port_open
+    with port_lock:
+        if port_open:
+            portHandler.closePort()
+            port_open = False
\ No newline at end of file
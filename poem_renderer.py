@@ -0,0 +1,160 @@
+# Renders the poems as images ready to be printed.
+
+# Poems are rendered as 1-bit images at the printer's native width of
+# 384 dots, so they can be handed to the printer data formatter without
+# resizing or dithering.
+
+"""
+Modules:
+    threading: Lock for the font registry
+    time: Font load times
+    weakref: Per-font measurement cache
+    PIL: Image manipulation
+"""
+
+import threading
+import time
+import weakref
+
+from PIL import Image, ImageFont, ImageDraw
+
+from m02_printer_data_formatter import PRINTER_WIDTH
+
+DEBUG = True
+
+FONT_SIZE = 30
+PADDING = 15
+LINE_SPACING = 6
+
+# Height of the image when it isn't fitted to the text
+FIXED_HEIGHT = 600
+
+# Size the image to the height of the text instead of FIXED_HEIGHT
+FIT_TO_CONTENT = True
+
+# Fonts loaded by (path, size), and the seconds it took to load them
+font_registry = {}
+font_load_times = {}
+font_registry_lock = threading.Lock()
+
+# Blank images by size, copied for every new poem
+blank_canvases = {}
+
+# Drawing context used to measure text
+measure_draw = ImageDraw.Draw(Image.new("1", (1, 1)))
+
+def get_font(font_path, font_size=FONT_SIZE):
+    """Return a font from the registry, loading it the first time"""
+    key = (font_path, font_size)
+    font = font_registry.get(key)
+    if font is None:
+        with font_registry_lock:
+            font = font_registry.get(key)
+            if font is None:
+                started = time.perf_counter()
+                font = ImageFont.truetype(font_path, font_size)
+                font_load_times[key] = time.perf_counter() - started
+                font_registry[key] = font
+    return font
+
+def warm_up_fonts(font_paths, font_size=FONT_SIZE):
+    """Load fonts into the registry ahead of time and report the load times"""
+    for font_path in font_paths:
+        try:
+            get_font(font_path, font_size)
+        except OSError as e:
+            print(f"Error loading font {font_path}: {e}")
+            continue
+        if DEBUG:
+            load_time = font_load_times[(font_path, font_size)]
+            print(f"Loaded font {font_path} ({font_size}) in {load_time * 1000:.1f} ms")
+
+def new_canvas(size):
+    """Return a blank 1-bit image, copied from a cached one"""
+    canvas = blank_canvases.get(size)
+    if canvas is None:
+        canvas = blank_canvases[size] = Image.new("1", size, 1)
+    return canvas.copy()
+
+def generate_image_from_text(
+    text: str,
+    font_path: str,
+    fit_to_content: bool = FIT_TO_CONTENT):
+    """Render text as a 1-bit image at the printer's native width"""
+
+    # Set the font
+    font = get_font(font_path, FONT_SIZE)
+
+    # Wrap the text
+    wrapped_text = wrap_text(text, font, PRINTER_WIDTH - 2 * PADDING)
+
+    # Calculate text position
+    text_position = (PADDING, PADDING)
+
+    # Set the image size, 384 dots wide to match the printer head,
+    # so the encoder doesn't need to resize or dither it
+    image_height = FIXED_HEIGHT
+    if fit_to_content:
+        # Measure the wrapped text, to only print as much paper as needed
+        text_bbox = measure_draw.multiline_textbbox(
+            text_position, wrapped_text, font=font, spacing=LINE_SPACING)
+        image_height = text_bbox[3] + PADDING
+
+    # Create the image
+    image = new_canvas((PRINTER_WIDTH, image_height))
+    draw = ImageDraw.Draw(image)
+
+    # Draw the text on the image
+    draw.multiline_text(text_position, wrapped_text, font=font, fill=0, spacing=LINE_SPACING)
+
+    if DEBUG:
+        print("Text image rendered")
+
+    return image
+
+# Advance width of every word measured with a font, per font
+word_widths_cache = weakref.WeakKeyDictionary()
+
+def get_word_width(font, word):
+    """Return the advance width of a word, measuring it only once per font"""
+    word_widths = word_widths_cache.get(font)
+    if word_widths is None:
+        word_widths = word_widths_cache[font] = {}
+    width = word_widths.get(word)
+    if width is None:
+        width = word_widths[word] = font.getlength(word)
+    return width
+
+# Function to wrap text to fit within the specified width,
+# while still keeping original line breaks
+def wrap_text(text, font, max_width):
+    """Wrap text to fit within the specified width, while still keeping original line breaks"""
+    # Summed advances can differ from the measured line by kerning and
+    # rounding, so lines within this margin of the limit are measured exactly
+    margin = font.size / 4
+    space_width = get_word_width(font, " ")
+
+    lines = text.split("\n")
+    wrapped_lines = []
+    for line in lines:
+        words = line.split()
+        wrapped_line = ""
+        wrapped_line_width = 0
+        for word in words:
+            wrapped_line_test = wrapped_line + word + " "
+            wrapped_line_test_width = wrapped_line_width + get_word_width(font, word) + space_width
+            if wrapped_line_test_width < max_width - margin:
+                fits = True
+            elif wrapped_line_test_width > max_width + margin:
+                fits = False
+            else:
+                fits = font.getbbox(wrapped_line_test)[2] <= max_width
+            if fits:
+                wrapped_line = wrapped_line_test
+                wrapped_line_width = wrapped_line_test_width
+            else:
+                wrapped_lines.append(wrapped_line)
+                wrapped_line = word + " "
+                wrapped_line_width = get_word_width(font, word) + space_width
+        wrapped_lines.append(wrapped_line)
+    return "\n".join(wrapped_lines)
@@ -0,0 +1,160 @@
+# Reservoir of poems generated ahead of time.
+
+# While the realejo is idle, a background thread keeps a few poems ready,
+# so a button press can hand one out at once instead of waiting for the
+# LLM. The poems are saved to disk, so they survive a restart, and every
+# poem is only handed out once.
+
+"""
+Modules:
+    hashlib
+    json
+    os
+    random
+    threading
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+
+DEBUG = True
+
+RESERVOIR_FILE = "generated-poems/reservoir.json"
+
+# Number of poems kept ready
+RESERVOIR_SIZE = 5
+
+# Seconds to wait between generations, to leave the LLM to other work
+REFILL_DELAY = 30
+
+# Seconds to wait after a failed generation
+RETRY_DELAY = 120
+
+# Number of handed out poems remembered, to never hand them out again
+MAX_SERVED = 1000
+
+def poem_key(poem):
+    """Return a key identifying a poem regardless of spacing and case"""
+    normalized = " ".join(poem.lower().split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+class PoemReservoir(threading.Thread):
+    """Thread that keeps RESERVOIR_SIZE poems ready to be handed out.
+
+    generate is called with a topic and returns a poem, or None if it
+    failed. New poems are only generated while the reservoir isn't paused,
+    so refilling doesn't compete with the interactions for the LLM.
+    """
+    def __init__(self, generate, topics, size=RESERVOIR_SIZE,
+                 reservoir_file=RESERVOIR_FILE):
+        super().__init__()
+        self.daemon = True
+        self.generate = generate
+        self.topics = topics
+        self.size = size
+        self.reservoir_file = reservoir_file
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+        self.poems = []
+        self.served = []
+
+        self.load()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.poems)
+
+    def load(self):
+        """Load the poems left by a previous run"""
+        try:
+            with open(self.reservoir_file, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            self.poems = data.get("poems", [])
+            self.served = data.get("served", [])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Error loading the poem reservoir: {e}")
+            return
+
+        if DEBUG:
+            print(f"Loaded {len(self.poems)} poems into the reservoir")
+
+    def save(self):
+        """Write the reservoir to disk atomically, holding the lock"""
+        temp_path = self.reservoir_file + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump({"poems": self.poems, "served": self.served}, file)
+            os.replace(temp_path, self.reservoir_file)
+        except OSError as e:
+            print(f"Error saving the poem reservoir: {e}")
+
+    def take(self):
+        """Hand out the oldest ready poem, or None if there is none"""
+        with self.lock:
+            if not self.poems:
+                return None
+            poem = self.poems.pop(0)
+            self.served.append(poem_key(poem))
+            del self.served[:-MAX_SERVED]
+            self.save()
+
+        if DEBUG:
+            print(f"Poem taken from the reservoir, {len(self)} left")
+        return poem
+
+    def add(self, poem):
+        """Add a poem, unless it was already handed out or is ready"""
+        key = poem_key(poem)
+        with self.lock:
+            if key in self.served or key in (poem_key(ready) for ready in self.poems):
+                if DEBUG:
+                    print("Skipping a poem already in the reservoir or handed out")
+                return False
+            self.poems.append(poem)
+            self.save()
+        return True
+
+    def pause(self):
+        """Stop generating new poems until resume() is called"""
+        self.resume_event.clear()
+
+    def resume(self):
+        """Go on generating poems"""
+        self.resume_event.set()
+
+    def stop(self):
+        """Stop the reservoir thread"""
+        self.stop_event.set()
+        self.resume_event.set()
+        self.join()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.resume_event.wait()
+            if self.stop_event.is_set():
+                break
+            if len(self) >= self.size:
+                self.stop_event.wait(REFILL_DELAY)
+                continue
+
+            try:
+                poem = self.generate(random.choice(self.topics))
+            except Exception as e:
+                print(f"Error generating a poem for the reservoir: {e}")
+                poem = None
+
+            if poem and poem.strip():
+                if self.add(poem.strip()) and DEBUG:
+                    print(f"Poem added to the reservoir, {len(self)} ready")
+                self.stop_event.wait(REFILL_DELAY)
+            else:
+                self.stop_event.wait(RETRY_DELAY)
+
+        print("Poem reservoir thread exiting...")
@@ -0,0 +1,244 @@
+# Background print spooler for the poems.
+
+# Interactions enqueue a print job and carry on, while the spooler thread
+# renders and sends the jobs to the printer in order. Jobs are kept as
+# JSON files in the spool folder until they are printed, so a poem isn't
+# lost if the program stops in the middle of a print. Jobs that fail too
+# many times are left in the folder with the failed status, but a printer
+# that is off or out of range doesn't count as a failure: the job waits
+# for it in the queue.
+
+"""
+Modules:
+    asyncio
+    json
+    os
+    threading
+    time
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+from m02_printer import PrinterNotFoundError
+
+DEBUG = True
+
+SPOOL_FOLDER = "print-spool"
+
+# Number of times a job is tried before it is given up
+MAX_ATTEMPTS = 3
+
+# Seconds to wait before retrying a job, doubled after every failure
+RETRY_DELAY = 2
+MAX_RETRY_DELAY = 60
+
+# Number of job latencies kept for monitoring
+MAX_LATENCIES = 100
+
+class JobStatus:
+    """Status of a print job"""
+    QUEUED = "queued"
+    PRINTING = "printing"
+    DONE = "done"
+    FAILED = "failed"
+
+class PrintJob:
+    """A poem to print, either as text to render or as printer data"""
+    def __init__(self, job_id, text=None, name=None, status=JobStatus.QUEUED,
+                 created=None, attempts=0, error=None):
+        self.id = job_id
+        self.text = text
+        self.name = name
+        self.status = status
+        self.created = created if created is not None else time.time()
+        self.attempts = attempts
+        self.error = error
+        self.data = None
+
+    def to_dict(self):
+        """Return the job fields saved in the spool file"""
+        return {
+            "id": self.id,
+            "text": self.text,
+            "name": self.name,
+            "status": self.status,
+            "created": self.created,
+            "attempts": self.attempts,
+            "error": self.error,
+        }
+
+class PrintSpooler(threading.Thread):
+    """Thread that prints the queued jobs one after the other.
+
+    render is called with a job that only has text and must return the
+    printer data for it. printer must have an async print(data) method,
+    such as m02_printer.PrinterSession, raising PrinterNotFoundError when
+    the printer can't be reached.
+    """
+    def __init__(self, printer, render, spool_folder=SPOOL_FOLDER):
+        super().__init__()
+        self.daemon = True
+        self.printer = printer
+        self.render = render
+        self.spool_folder = spool_folder
+        self.stop_event = threading.Event()
+        self.condition = threading.Condition()
+        self.jobs = []
+        self.latencies = []
+        self.last_id = 0
+
+        os.makedirs(self.spool_folder, exist_ok=True)
+        self.load_jobs()
+
+    @property
+    def queue_depth(self):
+        """Number of jobs waiting to be printed"""
+        with self.condition:
+            return len(self.jobs)
+
+    def load_jobs(self):
+        """Load the jobs left in the spool folder by a previous run"""
+        for file_name in sorted(os.listdir(self.spool_folder)):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.spool_folder, file_name), "r",
+                          encoding="utf-8") as file:
+                    fields = json.load(file)
+                job = PrintJob(fields.pop("id"), **fields)
+            except (OSError, ValueError, TypeError) as e:
+                print(f"Error loading print job {file_name}: {e}")
+                continue
+
+            if job.id.isdigit():
+                self.last_id = max(self.last_id, int(job.id))
+
+            if job.status in (JobStatus.DONE, JobStatus.FAILED):
+                continue
+
+            # A job that was printing when the program stopped is printed again
+            job.status = JobStatus.QUEUED
+            data_path = self.data_path(job)
+            if os.path.exists(data_path):
+                with open(data_path, "rb") as file:
+                    job.data = file.read()
+            self.jobs.append(job)
+
+        if self.jobs and DEBUG:
+            print(f"Loaded {len(self.jobs)} print jobs from {self.spool_folder}")
+
+    def job_path(self, job):
+        """Return the path of the spool file of a job"""
+        return os.path.join(self.spool_folder, f"{job.id}.json")
+
+    def data_path(self, job):
+        """Return the path of the printer data of a job"""
+        return os.path.join(self.spool_folder, f"{job.id}.bin")
+
+    def save_job(self, job):
+        """Write the job to its spool file atomically"""
+        temp_path = self.job_path(job) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(job.to_dict(), file)
+        os.replace(temp_path, self.job_path(job))
+
+    def remove_job(self, job):
+        """Remove the spool files of a job"""
+        for path in (self.job_path(job), self.data_path(job)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def new_job_id(self):
+        """Return a new job id that sorts after all the previous ones"""
+        job_id = max(int(time.time() * 1000), self.last_id + 1)
+        self.last_id = job_id
+        return f"{job_id:015d}"
+
+    def enqueue(self, text=None, data=None, name=None):
+        """Add a job to the queue, with the poem text or the printer data"""
+        with self.condition:
+            job = PrintJob(self.new_job_id(), text=text, name=name)
+            if data is not None:
+                job.data = data
+                with open(self.data_path(job), "wb") as file:
+                    file.write(data)
+            self.save_job(job)
+            self.jobs.append(job)
+            self.condition.notify()
+
+        if DEBUG:
+            print(f"Print job {job.id} queued, {self.queue_depth} in the queue")
+        return job
+
+    def stop(self):
+        """Stop the spooler, leaving the remaining jobs in the spool folder"""
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify()
+        self.join()
+
+    def run(self):
+        retry_delay = RETRY_DELAY
+        while not self.stop_event.is_set():
+            with self.condition:
+                while not self.jobs and not self.stop_event.is_set():
+                    self.condition.wait()
+                if self.stop_event.is_set():
+                    break
+                # Jobs are printed in order, so a failing job holds the queue
+                job = self.jobs[0]
+
+            self.print_job(job)
+            if job.status in (JobStatus.DONE, JobStatus.FAILED):
+                retry_delay = RETRY_DELAY
+                with self.condition:
+                    self.jobs.remove(job)
+            else:
+                self.stop_event.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+
+        print("Print spooler thread exiting...")
+
+    def print_job(self, job):
+        """Render and print a job, returning whether it was printed"""
+        job.status = JobStatus.PRINTING
+        self.save_job(job)
+        try:
+            if job.data is None:
+                job.data = self.render(job)
+            asyncio.run(self.printer.print(job.data))
+        except PrinterNotFoundError as e:
+            # Not the job's fault, keep it queued until the printer is back
+            print(f"Print job {job.id} waiting for the printer: {e}")
+            job.status = JobStatus.QUEUED
+            job.error = str(e)
+            self.save_job(job)
+            return False
+        except Exception as e:
+            job.attempts += 1
+            job.error = str(e)
+            if job.attempts >= MAX_ATTEMPTS:
+                print(f"Print job {job.id} failed after {job.attempts} attempts: {e}")
+                job.status = JobStatus.FAILED
+                self.save_job(job)
+            else:
+                print(f"Print job {job.id} failed, retrying: {e}")
+                job.status = JobStatus.QUEUED
+                self.save_job(job)
+            return False
+
+        job.status = JobStatus.DONE
+        latency = time.time() - job.created
+        self.latencies.append(latency)
+        del self.latencies[:-MAX_LATENCIES]
+        self.remove_job(job)
+        if DEBUG:
+            print(f"Print job {job.id} printed in {latency:.2f}s, "
+                  f"{self.queue_depth - 1} left in the queue")
+        return True
@@ -0,0 +1,113 @@
+# Cache of decoded sounds.
+
+# The realejo plays the same few clips over and over: the organ clips
+# while idle, and the stingers of every interaction. Instead of reading
+# and decoding them from disk every time, the decoded pygame.mixer.Sound
+# objects are kept in memory, up to a budget of bytes, evicting the least
+# recently played first. The files are never changed in place, new audio
+# gets new file names, so a path always decodes to the same sound.
+
+"""
+Modules:
+    collections
+    threading
+    pygame: Decoding of the sounds
+"""
+
+import collections
+import threading
+
+import pygame
+
+DEBUG = True
+
+# Bytes of decoded audio kept in memory
+MAX_BYTES = 64 * 1024 * 1024
+
+def sound_size(sound):
+    """Return the bytes of decoded audio held by a sound"""
+    frequency, sample_format, channels = pygame.mixer.get_init()
+    return int(sound.get_length() * frequency) * channels * (abs(sample_format) // 8)
+
+class SoundCache:
+    """LRU cache of decoded sounds, bounded by max_bytes.
+
+    Only the files in one of folders are cached, all of them without
+    folders.
+    """
+    def __init__(self, max_bytes=MAX_BYTES, folders=None):
+        self.max_bytes = max_bytes
+        self.folders = tuple(folders) if folders else None
+        self.lock = threading.Lock()
+        self.sounds = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sounds)
+
+    def caches(self, audio_file):
+        """Return whether an audio file is kept in the cache"""
+        return self.folders is None or audio_file.startswith(self.folders)
+
+    def get(self, audio_file):
+        """Return the decoded sound of an audio file, decoding it on a miss"""
+        with self.lock:
+            entry = self.sounds.get(audio_file)
+            if entry:
+                self.sounds.move_to_end(audio_file)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Decoded out of the lock, so hits don't wait for it
+        sound = pygame.mixer.Sound(audio_file)
+        size = sound_size(sound)
+        if size > self.max_bytes:
+            return sound
+
+        with self.lock:
+            if audio_file not in self.sounds:
+                self.sounds[audio_file] = (sound, size)
+                self.bytes += size
+            while self.bytes > self.max_bytes:
+                evicted, (_, evicted_size) = self.sounds.popitem(last=False)
+                self.bytes -= evicted_size
+                if DEBUG:
+                    print(f"Evicted {evicted} from the sound cache")
+        return sound
+
+    def prewarm(self, audio_files):
+        """Decode audio files ahead of their first play"""
+        for audio_file in audio_files:
+            try:
+                self.get(audio_file)
+            except (pygame.error, FileNotFoundError) as e:
+                print(f"Error decoding {audio_file}: {e}")
+
+    def invalidate(self, audio_file):
+        """Forget the sound of an audio file"""
+        with self.lock:
+            entry = self.sounds.pop(audio_file, None)
+            if entry:
+                self.bytes -= entry[1]
+
+    def stats(self):
+        """Return the hit rate, the sounds and the bytes resident"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "sounds": len(self.sounds),
+                "bytes": self.bytes,
+            }
+
+    def report(self):
+        """Print the stats of the cache"""
+        stats = self.stats()
+        print(f"Sound cache: {stats['hit_rate']:.0%} hits ({stats['hits']}/{stats['hits'] + stats['misses']}), "
+              f"{stats['sounds']} sounds, {stats['bytes'] / 1024 / 1024:.1f} MB resident")
@@ -0,0 +1,136 @@
+# Staged startup of the realejo.
+
+# The serial connection, the button and the audio come up first, so the
+# realejo can react to the button at once. The slow parts (the TTS model,
+# the fonts, the BLE stack) are started by phases on background threads,
+# and the features that need them wait on their readiness. The time taken
+# by every phase and by the imports of the heavy modules is reported.
+
+"""
+Modules:
+    importlib
+    threading
+    time
+"""
+
+import importlib
+import threading
+import time
+
+DEBUG = True
+
+class StartupRegistry:
+    """Readiness of the features of the program.
+
+    Every feature has a threading.Event, set once it is ready. Phases are
+    functions starting a feature, run in the foreground or on a thread,
+    and timed for the report.
+    """
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.lock = threading.Lock()
+        self.events = {}
+        self.import_times = []
+        self.phase_times = []
+        self.threads = []
+
+    def event(self, name):
+        """Return the readiness event of a feature"""
+        with self.lock:
+            if name not in self.events:
+                self.events[name] = threading.Event()
+            return self.events[name]
+
+    def add(self, name, event):
+        """Use an event set elsewhere as the readiness of a feature.
+
+        Callers already waiting on the feature wait on an event created by
+        event(), which is set once the new event is set.
+        """
+        with self.lock:
+            placeholder = self.events.get(name)
+            self.events[name] = event
+        if placeholder is None or placeholder is event:
+            return
+
+        def link():
+            event.wait()
+            placeholder.set()
+
+        thread = threading.Thread(target=link, name=f"startup-link-{name}")
+        thread.daemon = True
+        thread.start()
+
+    def mark_ready(self, name):
+        self.event(name).set()
+
+    def is_ready(self, name):
+        return self.event(name).is_set()
+
+    def wait_ready(self, name, timeout=None):
+        """Wait for a feature to be ready, returning whether it is"""
+        if not self.is_ready(name) and DEBUG:
+            print(f"Waiting for {name} to be ready...")
+        return self.event(name).wait(timeout)
+
+    def timed_import(self, module_name):
+        """Import a module, recording the time it took"""
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        with self.lock:
+            self.import_times.append((module_name, time.perf_counter() - started))
+        return module
+
+    def run_phase(self, name, function, background=False):
+        """Run a function starting a feature, and mark it ready once it returns.
+
+        A function returning False or raising failed, and the feature is
+        left not ready. In the background, the function runs on a daemon
+        thread.
+        """
+        def run():
+            started = time.perf_counter()
+            try:
+                result = function()
+            except Exception as e:
+                print(f"Error starting {name}: {e}")
+                result = False
+            with self.lock:
+                self.phase_times.append((name, time.perf_counter() - started, background))
+            if result is False:
+                print(f"Failed to start {name}")
+                return
+            self.mark_ready(name)
+            if DEBUG:
+                print(f"{name} ready {time.perf_counter() - self.started:.1f}s after start")
+
+        if not background:
+            run()
+            return
+        thread = threading.Thread(target=run, name=f"startup-{name}")
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def report(self):
+        """Print the time taken by the imports and the phases"""
+        with self.lock:
+            import_times = list(self.import_times)
+            phase_times = list(self.phase_times)
+        print(f"Startup report, {time.perf_counter() - self.started:.2f}s since start:")
+        for module_name, seconds in import_times:
+            print(f"  import {module_name:<28} {seconds:6.2f}s")
+        for name, seconds, background in phase_times:
+            where = "background" if background else "foreground"
+            print(f"  {where} {name:<24} {seconds:6.2f}s")
+
+    def report_when_started(self):
+        """Print the report once the background phases are done, from a thread"""
+        def wait_and_report():
+            for thread in self.threads:
+                thread.join()
+            self.report()
+
+        thread = threading.Thread(target=wait_and_report)
+        thread.daemon = True
+        thread.start()
@@ -0,0 +1,166 @@
+# Incremental builder of the pre-recorded TTS audio.
+
+# Every text is synthesized to a file named after a hash of the text, the
+# language, the reference voice and the TTS model, so reordering the texts
+# doesn't mislabel the files, and a file only has to be synthesized again
+# when one of them changes. A manifest in the output folder records what
+# every file was built from. Missing files are synthesized on a pool of
+# processes, each loading the model once, and the files of texts that
+# were removed are pruned.
+
+"""
+Modules:
+    concurrent.futures: Process pool synthesizing the files
+    hashlib
+    importlib.metadata: Version of the TTS package
+    json
+    os
+    time
+    voice_latents
+"""
+
+import concurrent.futures
+import hashlib
+import importlib.metadata
+import json
+import os
+import time
+
+from voice_latents import file_hash
+
+DEBUG = True
+
+TTS_MODEL = "tts_models/multilingual/multi-dataset/xtts_v2"
+TTS_DEVICE = "cpu"
+SPEAKER_WAV = "tts/voice-cloning/ref.wav"
+LANGUAGE = "en"
+
+MANIFEST_FILE = "manifest.json"
+
+# Processes synthesizing in parallel. Every one of them loads its own copy
+# of XTTS, so this is bound by memory more than by cores.
+MAX_WORKERS = 2
+
+# Model loaded once in every process of the pool
+worker_tts = None
+
+def get_model_version(model_name=TTS_MODEL):
+    """Return the TTS model and the version of the package running it"""
+    for package in ("coqui-tts", "TTS"):
+        try:
+            return f"{model_name}@{importlib.metadata.version(package)}"
+        except importlib.metadata.PackageNotFoundError:
+            continue
+    return model_name
+
+def asset_name(entry):
+    """Return the file name of the audio built from a manifest entry"""
+    key = json.dumps(entry, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16] + ".wav"
+
+def load_manifest(output_folder):
+    """Return the manifest of an output folder, {} if there is none"""
+    try:
+        with open(os.path.join(output_folder, MANIFEST_FILE), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Error loading the TTS manifest, rebuilding: {e}")
+        return {}
+
+def save_manifest(output_folder, manifest):
+    """Write the manifest of an output folder atomically"""
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def load_worker_model(model_name, device, threads):
+    """Load the TTS model in a process of the pool"""
+    global worker_tts
+    import torch
+    from TTS.api import TTS
+
+    # Share the cores between the processes instead of oversubscribing them
+    torch.set_num_threads(threads)
+    worker_tts = TTS(model_name).to(device)
+
+def synthesize_asset(text, speaker_wav, language, file_path):
+    """Synthesize a text to file_path in a process of the pool"""
+    from voice_latents import synthesize_to_file
+
+    started = time.perf_counter()
+    # Written next to the final file and moved in place, so an interrupted
+    # build never leaves a truncated file behind
+    temp_path = file_path + ".tmp.wav"
+    synthesize_to_file(worker_tts, text, speaker_wav, language, temp_path)
+    os.replace(temp_path, file_path)
+    return time.perf_counter() - started
+
+def build_assets(texts, output_folder, speaker_wav=SPEAKER_WAV, language=LANGUAGE,
+                 model_name=TTS_MODEL, device=TTS_DEVICE, max_workers=MAX_WORKERS):
+    """Synthesize the texts missing from output_folder and prune the others.
+
+    Returns the paths of the audio files of the texts, in their order.
+    """
+    started = time.perf_counter()
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = load_manifest(output_folder)
+    voice_hash = file_hash(speaker_wav)
+    model_version = get_model_version(model_name)
+
+    wanted = {}
+    for text in texts:
+        entry = {"text": text, "language": language,
+                 "voice_hash": voice_hash, "model": model_version}
+        wanted[asset_name(entry)] = entry
+
+    missing = [name for name, entry in wanted.items()
+               if manifest.get(name) != entry
+               or not os.path.exists(os.path.join(output_folder, name))]
+
+    # Remove the files of texts that were changed or removed, and the
+    # leftovers of interrupted builds. Other files, such as clips recorded
+    # by hand, were never built here and are left alone
+    pruned = 0
+    for file_name in os.listdir(output_folder):
+        if not file_name.endswith(".wav") or file_name in wanted:
+            continue
+        if file_name in manifest or file_name.endswith(".tmp.wav"):
+            os.remove(os.path.join(output_folder, file_name))
+            pruned += 1
+        elif DEBUG:
+            print(f"Leaving {file_name} in {output_folder}, it wasn't built from a text")
+    manifest = {name: entry for name, entry in manifest.items()
+                if name in wanted and name not in missing}
+
+    if missing:
+        workers = max(1, min(max_workers, len(missing)))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=load_worker_model,
+                initargs=(model_name, device, threads)) as pool:
+            jobs = {pool.submit(synthesize_asset, wanted[name]["text"], speaker_wav,
+                                language, os.path.join(output_folder, name)): name
+                    for name in missing}
+            for job in concurrent.futures.as_completed(jobs):
+                name = jobs[job]
+                try:
+                    synthesis_time = job.result()
+                except Exception as e:
+                    print(f"Error synthesizing {wanted[name]['text']!r}: {e}")
+                    continue
+                # Saved after every file, so an interrupted build keeps them
+                manifest[name] = wanted[name]
+                save_manifest(output_folder, manifest)
+                if DEBUG:
+                    print(f"Synthesized {name} in {synthesis_time:.1f}s: {wanted[name]['text']}")
+
+    save_manifest(output_folder, manifest)
+    if DEBUG:
+        print(f"{output_folder}: {len(missing)} synthesized, "
+              f"{len(wanted) - len(missing)} unchanged, {pruned} pruned "
+              f"in {time.perf_counter() - started:.1f}s")
+    return [os.path.join(output_folder, name) for name in wanted]
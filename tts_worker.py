@@ -0,0 +1,312 @@
+# Text-to-speech worker process.
+
+# XTTS v2 is loaded once in a separate process, so its CPU-heavy inference
+# doesn't compete for the GIL with the audio, button and servo threads of
+# the main process, and the main process doesn't wait for the model to
+# load at startup. Synthesis jobs are sent to the worker as JSON lines on
+# its stdin, the audio is written to the requested .wav file, and every
+# job reports its real-time factor (synthesis time divided by audio
+# duration) on the worker's stdout.
+# Streamed jobs are synthesized one line at a time, and every line is
+# written to its own part file as soon as it is ready, so it can be played
+# while the next lines are synthesized.
+# The worker is started by TTSWorker, which runs this file as a script, and
+# started again with a growing delay if it crashes or is killed.
+
+#! /usr/bin/python3
+
+"""
+Modules:
+    argparse
+    concurrent.futures: Futures of the synthesis jobs
+    itertools
+    json
+    os
+    subprocess
+    sys
+    threading
+    time
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from audio_catalog import get_wav_duration
+
+DEBUG = True
+
+TTS_MODEL = "tts_models/multilingual/multi-dataset/xtts_v2"
+TTS_DEVICE = "cpu"
+SPEAKER_WAV = "tts/voice-cloning/ref.wav"
+LANGUAGE = "en"
+
+# Seconds to wait for the worker to finish its jobs when stopping
+STOP_TIMEOUT = 30
+
+# Seconds to wait before restarting a worker that exited, doubled after
+# every exit until a job is synthesized again
+RESTART_DELAY = 5
+MAX_RESTART_DELAY = 300
+
+class SynthesisResult:
+    """Result of a synthesis job"""
+    def __init__(self, file_path, synthesis_time, audio_duration):
+        self.file_path = file_path
+        self.synthesis_time = synthesis_time
+        self.audio_duration = audio_duration
+        # Seconds from queueing a streamed job to its first part
+        self.time_to_first_audio = None
+
+    @property
+    def real_time_factor(self):
+        """Seconds of synthesis per second of audio"""
+        if self.audio_duration <= 0:
+            return 0.0
+        return self.synthesis_time / self.audio_duration
+
+class SpeechPart:
+    """Line of a streamed synthesis job, ready to be played"""
+    def __init__(self, index, file_path, time_to_audio):
+        self.index = index
+        self.file_path = file_path
+        self.time_to_audio = time_to_audio
+
+class PendingJob:
+    """Synthesis job queued to the worker"""
+    def __init__(self, on_part):
+        self.future = concurrent.futures.Future()
+        self.on_part = on_part
+        self.queued = time.perf_counter()
+        self.time_to_first_audio = None
+
+def part_path(parts_prefix, index):
+    """Return the path of a part of a streamed job"""
+    return f"{parts_prefix}{index}.wav"
+
+class TTSWorker:
+    """Handle of the TTS worker process.
+
+    synthesize() returns a concurrent.futures.Future that resolves to a
+    SynthesisResult once the audio file is written. With on_part, the job
+    is streamed, and on_part is called from the results thread with a
+    SpeechPart for every line, as soon as it is synthesized. A worker that
+    exits before stop() is restarted after restart_delay seconds.
+    """
+    def __init__(self, model_name=TTS_MODEL, device=TTS_DEVICE):
+        self.model_name = model_name
+        self.device = device
+        self.process = None
+        self.results_thread = None
+        self.ready_event = threading.Event()
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.job_ids = itertools.count()
+        self.load_time = None
+        self.stop_event = threading.Event()
+        self.restart_delay = RESTART_DELAY
+        self.restarts = 0
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Start the worker process, which loads the model in the background"""
+        if self.is_alive():
+            return
+        self.stop_event.clear()
+        self.ready_event.clear()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__),
+             "--model", self.model_name, "--device", self.device],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, encoding="utf-8")
+        self.results_thread = threading.Thread(target=self.collect_results,
+                                               args=(self.process,))
+        self.results_thread.daemon = True
+        self.results_thread.start()
+
+    def stop(self):
+        """Stop the worker process after the queued jobs"""
+        with self.lock:
+            # Set under the lock, so the worker isn't restarted after this
+            self.stop_event.set()
+        if self.process is None:
+            return
+        try:
+            # The worker exits at the end of its input
+            self.process.stdin.close()
+            self.process.wait(timeout=STOP_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.results_thread.join()
+        self.process = None
+
+    def wait_ready(self, timeout=None):
+        """Wait for the model to be loaded, returning whether it is"""
+        return self.ready_event.wait(timeout)
+
+    def synthesize(self, text, file_path, speaker_wav=SPEAKER_WAV, language=LANGUAGE,
+                   on_part=None, parts_prefix=None):
+        """Queue a synthesis job and return its future.
+
+        The parts of a streamed job are written to parts_prefix followed
+        by the line number, by default next to file_path.
+        """
+        pending = PendingJob(on_part)
+        job = {"id": next(self.job_ids), "text": text, "file_path": file_path,
+               "speaker_wav": speaker_wav, "language": language}
+        if on_part:
+            job["parts_prefix"] = parts_prefix or os.path.splitext(file_path)[0] + "_part"
+        with self.lock:
+            if not self.is_alive():
+                pending.future.set_exception(RuntimeError("TTS worker isn't running"))
+                return pending.future
+            self.jobs[job["id"]] = pending
+            try:
+                self.process.stdin.write(json.dumps(job) + "\n")
+                self.process.stdin.flush()
+            except OSError as e:
+                del self.jobs[job["id"]]
+                pending.future.set_exception(RuntimeError(f"TTS worker isn't running: {e}"))
+        return pending.future
+
+    def collect_results(self, process):
+        """Resolve the futures of the jobs with the results of the worker"""
+        for line in process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+
+            if message["status"] == "ready":
+                self.load_time = message["load_time"]
+                self.ready_event.set()
+                if DEBUG:
+                    print(f"TTS model loaded in {self.load_time:.1f}s")
+                continue
+
+            if message["status"] == "part":
+                with self.lock:
+                    pending = self.jobs.get(message["id"])
+                if not pending:
+                    continue
+                part = SpeechPart(message["index"], message["file_path"],
+                                  time.perf_counter() - pending.queued)
+                if part.index == 0:
+                    pending.time_to_first_audio = part.time_to_audio
+                    if DEBUG:
+                        print(f"First speech part ready in {part.time_to_audio:.1f}s")
+                try:
+                    pending.on_part(part)
+                except Exception as e:
+                    print(f"Error handling speech part {part.file_path}: {e}")
+                continue
+
+            with self.lock:
+                pending = self.jobs.pop(message.get("id"), None)
+            if message["status"] == "done":
+                self.restart_delay = RESTART_DELAY
+                result = SynthesisResult(message["file_path"], message["synthesis_time"],
+                                         message["audio_duration"])
+                if pending:
+                    result.time_to_first_audio = pending.time_to_first_audio
+                if DEBUG:
+                    print(f"Speech synthesized to {result.file_path}: "
+                          f"{result.audio_duration:.1f}s of audio in {result.synthesis_time:.1f}s, "
+                          f"real-time factor {result.real_time_factor:.2f}")
+                if pending:
+                    pending.future.set_result(result)
+            else:
+                print(f"Error in TTS worker: {message['error']}")
+                if pending:
+                    pending.future.set_exception(RuntimeError(message["error"]))
+
+        # Fail the jobs left when the worker exited
+        with self.lock:
+            for pending in self.jobs.values():
+                pending.future.set_exception(RuntimeError("TTS worker exited"))
+            self.jobs.clear()
+        self.restart(process)
+
+    def restart(self, process):
+        """Start the worker again after it exited, unless it was stopped"""
+        process.wait()
+        if self.stop_event.is_set():
+            return
+        self.ready_event.clear()
+        print(f"TTS worker exited with code {process.returncode}, "
+              f"restarting it in {self.restart_delay}s")
+        if self.stop_event.wait(self.restart_delay):
+            return
+        self.restart_delay = min(self.restart_delay * 2, MAX_RESTART_DELAY)
+        with self.lock:
+            if self.stop_event.is_set():
+                return
+            self.restarts += 1
+            self.start()
+
+def run_worker(model_name, device):
+    """Load the TTS model and synthesize the jobs read from stdin"""
+    # Keep stdout for the results, and send everything TTS prints to stderr
+    results = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def send(message):
+        results.write(json.dumps(message) + "\n")
+        results.flush()
+
+    started = time.perf_counter()
+    try:
+        # Imported here, so only the worker process pays for it
+        from TTS.api import TTS
+        from voice_latents import get_conditioning_latents, synthesize_lines, synthesize_to_file
+        tts = TTS(model_name).to(device)
+        # Have the latents of the default voice ready for the first job
+        get_conditioning_latents(tts, SPEAKER_WAV)
+    except Exception as e:
+        send({"status": "error", "error": f"Failed to load {model_name}: {e}"})
+        return
+    send({"status": "ready", "load_time": time.perf_counter() - started})
+
+    for line in sys.stdin:
+        job = json.loads(line)
+        try:
+            started = time.perf_counter()
+            if "parts_prefix" in job:
+                wav = []
+                lines = synthesize_lines(tts, job["text"], job["speaker_wav"], job["language"])
+                for index, line_wav in enumerate(lines):
+                    file_path = part_path(job["parts_prefix"], index)
+                    tts.synthesizer.save_wav(wav=line_wav, path=file_path)
+                    send({"status": "part", "id": job["id"], "index": index,
+                          "file_path": file_path})
+                    wav += line_wav
+                # Keep the whole speech too, to be played again later
+                tts.synthesizer.save_wav(wav=wav, path=job["file_path"])
+            else:
+                synthesize_to_file(tts, job["text"], job["speaker_wav"], job["language"],
+                                   job["file_path"])
+            send({"status": "done", "id": job["id"], "file_path": job["file_path"],
+                  "synthesis_time": time.perf_counter() - started,
+                  "audio_duration": get_wav_duration(job["file_path"])})
+        except Exception as e:
+            send({"status": "error", "id": job["id"], "error": str(e)})
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="TTS worker process")
+    parser.add_argument("--model", default=TTS_MODEL)
+    parser.add_argument("--device", default=TTS_DEVICE)
+    args = parser.parse_args()
+    run_worker(args.model, args.device)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Cached XTTS conditioning latents of the cloned voice.
+
+# Passing speaker_wav to TTS.tts_to_file() makes XTTS compute the speaker
+# embedding and the GPT conditioning latents of the reference audio again
+# for every line. They only depend on the reference audio, so they are
+# computed once and saved to disk, keyed by a hash of the reference file
+# and of the conditioning settings. A changed reference file or setting
+# gets a new hash, so its latents are computed again and the stale ones
+# are removed.
+# The conditioning and sampling settings are taken from the model config,
+# as Xtts.synthesize() does for tts_to_file(), so the voice sounds the same.
+
+"""
+Modules:
+    hashlib
+    json
+    os
+    threading
+    time
+    torch: Saving and loading the latents
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import torch
+
+DEBUG = True
+
+LATENTS_FOLDER = "tts/voice-cloning/latents"
+
+# Samples of silence between sentences, as TTS.tts_to_file() does
+SENTENCE_SILENCE = 10000
+
+# (speaker_wav, settings key) -> (size, mtime, hash, (gpt_cond_latent, speaker_embedding))
+latents_cache = {}
+latents_cache_lock = threading.Lock()
+
+def file_hash(file_path):
+    """Return the SHA-256 hash of a file"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def conditioning_settings(model):
+    """Return the conditioning settings Xtts.synthesize() takes from the config"""
+    config = model.config
+    return {
+        "gpt_cond_len": config.gpt_cond_len,
+        "gpt_cond_chunk_len": config.gpt_cond_chunk_len,
+        "max_ref_length": config.max_ref_len,
+        "sound_norm_refs": config.sound_norm_refs,
+    }
+
+def sampling_settings(model):
+    """Return the sampling settings Xtts.synthesize() takes from the config"""
+    config = model.config
+    return {
+        "temperature": config.temperature,
+        "length_penalty": config.length_penalty,
+        "repetition_penalty": config.repetition_penalty,
+        "top_k": config.top_k,
+        "top_p": config.top_p,
+    }
+
+def latents_path(speaker_wav, speaker_hash, settings, latents_folder=LATENTS_FOLDER):
+    """Return the path of the cached latents of a reference file and settings"""
+    name = os.path.splitext(os.path.basename(speaker_wav))[0]
+    key = hashlib.sha256((speaker_hash + json.dumps(settings, sort_keys=True)).encode("utf-8"))
+    return os.path.join(latents_folder, f"{name}-{key.hexdigest()[:16]}.pth")
+
+def remove_stale_latents(speaker_wav, current_path):
+    """Remove the latents cached for earlier versions of a reference file"""
+    folder = os.path.dirname(current_path)
+    prefix = os.path.splitext(os.path.basename(speaker_wav))[0] + "-"
+    for file_name in os.listdir(folder):
+        file_path = os.path.join(folder, file_name)
+        if file_name.startswith(prefix) and file_name.endswith(".pth") and file_path != current_path:
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                # Removed by another process using the same voice
+                continue
+            if DEBUG:
+                print(f"Removed stale voice latents {file_path}")
+
+def get_conditioning_latents(tts, speaker_wav, latents_folder=LATENTS_FOLDER):
+    """Return (gpt_cond_latent, speaker_embedding) of a reference file.
+
+    The reference file is only hashed again when its size or modification
+    time changed.
+    """
+    model = tts.synthesizer.tts_model
+    settings = conditioning_settings(model)
+    cache_key = (speaker_wav, json.dumps(settings, sort_keys=True))
+    stat = os.stat(speaker_wav)
+    with latents_cache_lock:
+        cached = latents_cache.get(cache_key)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[3]
+
+        speaker_hash = file_hash(speaker_wav)
+        if cached and cached[2] == speaker_hash:
+            latents_cache[cache_key] = (stat.st_size, stat.st_mtime_ns, speaker_hash, cached[3])
+            return cached[3]
+
+        path = latents_path(speaker_wav, speaker_hash, settings, latents_folder)
+        started = time.perf_counter()
+        try:
+            saved = torch.load(path)
+            latents = (saved["gpt_cond_latent"], saved["speaker_embedding"])
+            if DEBUG:
+                print(f"Loaded voice latents from {path} in {time.perf_counter() - started:.2f}s")
+        except (OSError, KeyError, RuntimeError):
+            latents = model.get_conditioning_latents(audio_path=[speaker_wav], **settings)
+            if DEBUG:
+                print(f"Computed voice latents of {speaker_wav} in {time.perf_counter() - started:.2f}s")
+
+            os.makedirs(latents_folder, exist_ok=True)
+            # Several processes may compute the same latents at once
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            torch.save({"gpt_cond_latent": latents[0], "speaker_embedding": latents[1]}, temp_path)
+            os.replace(temp_path, path)
+            remove_stale_latents(speaker_wav, path)
+
+        latents_cache[cache_key] = (stat.st_size, stat.st_mtime_ns, speaker_hash, latents)
+        return latents
+
+def synthesize_wav(tts, text, speaker_wav, language):
+    """Return the samples of text spoken in the voice of speaker_wav"""
+    gpt_cond_latent, speaker_embedding = get_conditioning_latents(tts, speaker_wav)
+    model = tts.synthesizer.tts_model
+    settings = sampling_settings(model)
+    wav = []
+    for sentence in tts.synthesizer.split_into_sentences(text):
+        output = model.inference(sentence, language, gpt_cond_latent, speaker_embedding,
+                                 **settings)
+        wav += list(output["wav"])
+        wav += [0] * SENTENCE_SILENCE
+    return wav
+
+def synthesize_lines(tts, text, speaker_wav, language):
+    """Yield the samples of every non-empty line of text, one line at a time"""
+    for line in text.splitlines():
+        if line.strip():
+            yield synthesize_wav(tts, line, speaker_wav, language)
+
+def synthesize_to_file(tts, text, speaker_wav, language, file_path):
+    """Like TTS.tts_to_file(), with the cached latents of speaker_wav"""
+    tts.synthesizer.save_wav(wav=synthesize_wav(tts, text, speaker_wav, language),
+                             path=file_path)